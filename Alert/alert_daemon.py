@@ -0,0 +1,29 @@
+import asyncio
+import argparse
+from Functions.monitor import load_monitors, run_monitors, MAX_WORKERS
+from Functions.metrics import start_metrics_server, METRICS_PORT
+
+MONITOR_MODULES = [
+    'Alert.agc_mint_alert',
+    'Alert.clone_x_floor_alert',
+    'Alert.clonex_last_sale_alert',
+    'Alert.clonex_sniper_alert',
+]
+
+
+def main(module_names=MONITOR_MODULES, max_workers=MAX_WORKERS, metrics_port=METRICS_PORT):
+    monitors = load_monitors(module_names)
+    start_metrics_server(metrics_port)
+    print(f"START Alert Daemon with {len(monitors)} monitors: {monitors}")
+    asyncio.run(run_monitors(monitors, max_workers))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--monitors', type=str, help='comma separated alert modules to load', default="")
+    parser.add_argument('--workers', type=int, help='Number of checks running at the same time', default=MAX_WORKERS)
+    parser.add_argument('--metrics-port', type=str, help='Port of the /metrics endpoint, empty to disable', default=METRICS_PORT)
+    args = parser.parse_args()
+
+    module_names = args.monitors.split(',') if args.monitors else MONITOR_MODULES
+    main(module_names, args.workers, args.metrics_port)
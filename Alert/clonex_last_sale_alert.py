@@ -1,69 +1,45 @@
-import time
 from time import sleep
-from Functions.scraping_tools import get_response
-from Functions.file_handler import save_pickle, load_pickle
-from Functions.telegrambot import telegram_bot_sendtext, telegram_bot_sendphoto_url, bot_chatID_private
+from Functions.monitor import Monitor, run_check
+from Functions.metrics import start_metrics_server
+from Functions.event_feed import EventFeed, get_event_time
+from Functions.prices import format_eth
+from Functions.telegrambot import telegram_bot_queue_text, telegram_bot_sendphoto_url, bot_chatID_private
 
 COLLECTION  = 'clonex'
-PICKLE_FILE = '../Data/clonex_last_sale.pickle'
-SLEEP       = 10
+PICKLE_FILE = '../Data/clonex_last_sale_feed.pickle'
+SLEEP       = 5
+BOT_CHAT_ID = '-1001661074217'
 
+# successful sales since the stored watermark, state survives restarts
+SALE_FEED = EventFeed(COLLECTION, 'successful', PICKLE_FILE)
 
-def get_asset_list(limit=20, collection='', order_by='', order_direction='desc', owner=''):
-    url = f"https://api.opensea.io/api/v1/assets?order_direction={order_direction}&limit={limit}"
-    if collection:
-        url += f"&collection={collection}"
-    if order_by:
-        url += f"&order_by={order_by}"
-    if owner:
-        url += f"&owner={owner}"
 
-    res  = get_response(url)
-    data = res.json()
-    return data['assets']
+def get_sale_message(event):
+    name      = event['asset']['name'].replace('#', '')
+    timestamp = event['event_timestamp'].replace('T', ' ')[:19]
+    os_link   = event['asset']['permalink']
+    price     = format_eth(event['total_price'])
+    message   = f"{timestamp} - *{name}*\nSold for: *{price} ETH*\nView on [OpenSea]({os_link})"
+    message  += '\n\n-----\nIf you have any issues or feedback, feel free to [contact me](tg://user?id=383615621) :)'
+    message  += '\nCheck out my other [Telegram-Bots](https://linktr.ee/v1et4nh)'
+    return message
 
 
-def get_last_message(file=PICKLE_FILE):
-    try:
-        last_messages = load_pickle(file)
-        if 'Error' in last_messages:
-            last_messages = []
-        return last_messages
-    except:
-        last_messages = []
-        return last_messages
+def get_last_sale(feed=SALE_FEED):
+    for event in feed.poll():
+        if event.get('asset'):  # bundle sales have no single asset
+            telegram_bot_queue_text(get_sale_message(event), bot_chatID=BOT_CHAT_ID, created_at=get_event_time(event))
 
 
-def get_last_sale():
-    check_num = 10
-    sale_list = get_asset_list(limit=check_num, collection=COLLECTION, order_by='sale_date')
-    for item in reversed(sale_list):
-        name      = item['name'].replace('#', '')
-        timestamp = item['last_sale']['event_timestamp'].replace('T', ' ')
-        os_link   = item['permalink']
-        price     = float(item['last_sale']['total_price'])/1000000000000000000
-        message   = f"{timestamp} - *{name}*\nSold for: *{price} ETH*\nView on [OpenSea]({os_link})"
-        message  += '\n\n-----\nIf you have any issues or feedback, feel free to [contact me](tg://user?id=383615621) :)'
-        message  += '\nCheck out my other [Telegram-Bots](https://linktr.ee/v1et4nh)'
-
-        last_messages = get_last_message()
-        if len(last_messages) > check_num + 5:
-            last_messages.pop(0)
-        if message not in last_messages:
-            telegram_bot_sendtext(message, bot_chatID='-1001661074217')
-            last_messages.append(message)
-            save_pickle(last_messages, PICKLE_FILE)
+# plugin for Alert/alert_daemon.py
+MONITOR = Monitor(f'{COLLECTION} last sale', COLLECTION, SLEEP, get_last_sale, chat_id=BOT_CHAT_ID)
 
 
 def main(time_intervall=SLEEP):
+    start_metrics_server()
     while True:
-        try:
-            print(time.strftime('%X %x %Z'))
-            get_last_sale()
-            sleep(time_intervall)
-        except:
-            print('Restart...')
-            sleep(time_intervall)
+        run_check(MONITOR)
+        sleep(time_intervall)
 
 
 if __name__ == '__main__':
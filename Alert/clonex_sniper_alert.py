@@ -1,75 +1,128 @@
-import requests
 import time
-import lxml.html as lh
+import atexit
 import pandas as pd
 from time import sleep
+from Functions.scraping_tools import get_response, get_os_stats, get_eth_price
+from Functions.monitor import Monitor, run_check
+from Functions.metrics import start_metrics_server
+from Functions.snipe_rules import load_snipe_rules, get_snipe_mask
+from Functions.html_tables import compile_schema, get_table_rows
 from Functions.file_handler import save_pickle, load_pickle
-from Functions.telegrambot import telegram_bot_sendtext, bot_chatID_private
+from Functions.telegrambot import telegram_bot_queue_text, bot_chatID_private
 
 
 NAME        = 'CloneX'
 OPENSEA     = 'clonex'
 SLEEP       = 60
+BOT_CHAT_ID = '-1001766067718'
 PRICE_ALARM = 1000000  # ETH
 PICKLE_FILE = '../Data/clonex_sniper.pickle'
-
-
-def getSniperStats(limit=7):
+SNIPE_RULES = 'clonex_sniper'  # rule set in snipe_rules.json
+# columns of the wuestenigel table in the names the snipe rules use
+RULE_COLUMNS  = {'Preis': 'starting_price', 'Score': 'rarity_score', 'Rang': 'rarity_rank'}
+TABLE_COLUMNS = ['Preis', 'Score', 'Rang', 'Date']
+# cells of a row of the wuestenigel table: thumb, price, score, rank ("12 (top 1%)"), link to the token, date
+TABLE_SCHEMA = compile_schema({
+    'Preis': ('td[2]', lambda text: round(float(text), 2)),
+    'Score': ('td[3]', int),
+    'Rang':  ('td[4]', lambda text: int(text.split()[0])),
+    'url':   ('td[5]//a/@href', str),
+    'Date':  ('td[6]', str),
+})
+SNAPSHOT_FILE     = '../Data/clonex_sniper_rows.pickle'  # matching rows of the last cycle by token url
+SNAPSHOT_INTERVAL = 300  # seconds between two snapshots of the rows
+
+
+def get_sniper_rows(limit=7):
+    '''
+    Reads the wuestenigel sniper table into {token url: row}, rows are dicts with the columns of TABLE_SCHEMA.
+    Returns None if the page could not be fetched.
+    '''
     url = 'https://nft.wuestenigel.com/sniper/'
     if limit > 0:
         url += '&limit=' + str(limit)
-    res = requests.get(url)
-    if res.status_code != 200:
-        res = requests.get(url, headers={"User-Agent": "Mozilla/5.0"})
-        if res.status_code != 200:
-            telegram_bot_sendtext('Error: Cannot get data from wuestenigel', bot_chatID=bot_chatID_private)
-            return 'RequestsError'
-    doc = lh.fromstring(res.content)
-    tr_elements = doc.xpath('//tr')
-
-    # Get Header
-    col = []
-    for t in tr_elements[0]:
-        name_col = t.text_content()
-        col.append((name_col, []))
-
-    # Get Table
-    for idx, (thumb, price, score, rank, url, date) in enumerate(tr_elements):
-        if idx == 0:
-            continue
-        thumb = ''
-        price = round(float(price.text_content()), 2)
-        score = int(score.text_content())
-        rank  = int(rank.text_content().split()[0])
-        url   = url.getchildren()[0].attrib['href']
-        date  = date.text_content()
-
-        if price < 5 or score > 500:
-            col[0][1].append(thumb)
-            col[1][1].append(price)
-            col[2][1].append(score)
-            col[3][1].append(rank)
-            col[4][1].append(url)
-            col[5][1].append(date)
-
-    tmp_dict = {title:column for (title, column) in col}
-    df = pd.DataFrame(tmp_dict)
-    df = df.drop(columns=['Thumb'])
-    df = df.drop(columns=['Rang'])
-    df = df.sort_values(['Preis', 'Score'])
-    stats = getOSstats()
-    floor_price = float(stats['floor_price'])
-    print(f"{NAME}: {floor_price}")
-    last_df = get_last_message()
-    if not df.equals(last_df):
-        stats = getOSstats()
-        floor_price = float(stats['floor_price'])
-        message = f"*Floor Price: {format(floor_price, '.2f')}*\n"
-        message += '\nURL | Price | Score'
-        for row in df.itertuples():
-            message += f"\n[link]({row.Traits})  |  {format(row.Preis, '.2f')}  |  {row.Score}"
-        telegram_bot_sendtext(message, bot_chatID='-1001766067718', disable_web_page_preview=True)
-        save_pickle(df, PICKLE_FILE)
+    res = get_response(url)
+    if res == 'RequestsError':
+        telegram_bot_queue_text('Error: Cannot get data from wuestenigel', bot_chatID=bot_chatID_private)
+        return None
+    return get_table_rows(res.content, TABLE_SCHEMA, key='url')
+
+
+def filter_snipes(rows):
+    '''keeps the rows that match a snipe rule, the rules are evaluated on all rows at once'''
+    if not rows:
+        return {}
+    df = pd.DataFrame.from_dict(rows, orient='index', columns=TABLE_COLUMNS)
+    mask = get_snipe_mask(df.rename(columns=RULE_COLUMNS), load_snipe_rules(SNIPE_RULES))
+    return {token_url: rows[token_url] for token_url in df.index[mask]}
+
+
+def get_delta(old_rows, new_rows):
+    '''
+    Compares two snapshots {token url: row} by key. Returns the added urls, the removed urls and the urls whose
+    price changed.
+    '''
+    added    = [token_url for token_url in new_rows if token_url not in old_rows]
+    removed  = [token_url for token_url in old_rows if token_url not in new_rows]
+    repriced = [
+        token_url for token_url, row in new_rows.items()
+        if token_url in old_rows and row['Preis'] != old_rows[token_url]['Preis']
+    ]
+    return added, removed, repriced
+
+
+def get_delta_message(floor_price, new_rows, old_rows, added, repriced):
+    message = f"*Floor Price: {format(floor_price, '.2f')}*\n"
+    message += '\nURL | Price | Score'
+    for token_url in sorted(added, key=lambda token_url: (new_rows[token_url]['Preis'], new_rows[token_url]['Score'])):
+        row = new_rows[token_url]
+        message += f"\n[link]({token_url})  |  {format(row['Preis'], '.2f')}  |  {row['Score']}"
+    for token_url in sorted(repriced, key=lambda token_url: new_rows[token_url]['Preis']):
+        row = new_rows[token_url]
+        message += f"\n[link]({token_url})  |  {format(old_rows[token_url]['Preis'], '.2f')} -> {format(row['Preis'], '.2f')}  |  {row['Score']}"
+    return message
+
+
+class SniperMonitor:
+    '''
+    Incremental sniper alert. The matching rows of the last cycle are kept in memory keyed by token url, every
+    cycle only the added and repriced rows are sent, removed rows are dropped silently. The rows are written to
+    SNAPSHOT_FILE at most every SNAPSHOT_INTERVAL seconds, so a restart does not send the whole table again.
+    '''
+
+    def __init__(self, snapshot_file=SNAPSHOT_FILE):
+        self.snapshot_file = snapshot_file
+        snapshot = load_pickle(snapshot_file)
+        self.rows     = snapshot if isinstance(snapshot, dict) and 'Error' not in snapshot else {}
+        self.saved_at = time.monotonic()
+        self.dirty    = False
+
+    def check(self):
+        new_rows = get_sniper_rows()
+        if new_rows is None:
+            return
+        new_rows = filter_snipes(new_rows)
+        added, removed, repriced = get_delta(self.rows, new_rows)
+        if added or repriced:
+            floor_price = float(get_os_stats(OPENSEA)['floor_price'])
+            print(f"{NAME}: {floor_price}, {len(added)} new and {len(repriced)} repriced snipes")
+            message = get_delta_message(floor_price, new_rows, self.rows, added, repriced)
+            telegram_bot_queue_text(message, bot_chatID=BOT_CHAT_ID, disable_web_page_preview=True)
+        if added or removed or repriced:
+            self.rows  = new_rows
+            self.dirty = True
+        if self.dirty and time.monotonic() - self.saved_at > SNAPSHOT_INTERVAL:
+            self.save()
+
+    def save(self):
+        if self.dirty:
+            save_pickle(self.rows, self.snapshot_file)
+            self.dirty = False
+        self.saved_at = time.monotonic()
+
+
+SNIPER = SniperMonitor()
+atexit.register(SNIPER.save)
 
 
 def get_last_message():
@@ -80,47 +133,14 @@ def get_last_message():
         return pd.DataFrame({'A': []})
 
 
-def getData(url):
-    res = requests.get(url)
-    if res.status_code != 200:
-        res = requests.get(url, headers={"User-Agent": "Mozilla/5.0"})
-        if res.status_code != 200:
-            return 'RequestsError'
-    data = res.json()
-    return data
-
-
-def getETHprice():
-    url_eur = "https://api.coingecko.com/api/v3/simple/price?ids=ethereum&vs_currencies=eur%2Cbtc&include_market_cap=true&include_24hr_change=true"
-    url_usd = "https://api.coingecko.com/api/v3/simple/price?ids=ethereum&vs_currencies=usd%2Cbtc&include_market_cap=true&include_24hr_change=true"
-    data_eur = requests.get(url_eur).json()
-    peur = round(data_eur["ethereum"]["eur"], 2)
-    peur = format(peur, ",")
-    peur_val = float(peur.replace(',', ''))
-    data = requests.get(url_usd).json()
-    pusd = round(data["ethereum"]["usd"], 2)
-    pusd = format(pusd, ",")
-    pusd_val = float(pusd.replace(',', ''))
-
-    return peur_val, pusd_val
-
-
-def getOSstats(collection=OPENSEA):
-    url = "https://api.opensea.io/api/v1/collection/" + collection
-    data = getData(url)
-    stats = data['collection']['stats']
-
-    return stats
-
-
 def run_os_stats():
-    stats = getOSstats()
+    stats = get_os_stats(OPENSEA)
     last_floor = get_last_message()
     floor_price = float(stats['floor_price'])
     message  = NAME + ': ' + str(floor_price)
     print(message)
     if floor_price < PRICE_ALARM and abs(floor_price - last_floor) > 0:
-        eur, usd, = getETHprice()
+        eur, usd = get_eth_price()
         eur_price = int(eur * floor_price)
         usd_price = int(usd * floor_price)
         url       = 'https://opensea.io/collection/' + OPENSEA
@@ -130,20 +150,20 @@ def run_os_stats():
         message  += '\n\nView in [Opensea](' + url + ')'
         message  += '\n\n-----\nIf you have any issues or feedback, feel free to [contact me](tg://user?id=383615621) :)'
         message  += '\nCheck out my other [Telegram-Bots](https://linktr.ee/v1et4nh)'
-        telegram_bot_sendtext(message, bot_chatID='-1001566937584', disable_web_page_preview=True)
+        telegram_bot_queue_text(message, bot_chatID='-1001566937584', disable_web_page_preview=True)
         dict_floor = {'floor': floor_price}
         save_pickle(dict_floor, PICKLE_FILE)
 
 
+# plugin for Alert/alert_daemon.py
+MONITOR = Monitor(NAME, OPENSEA, SLEEP, SNIPER.check, chat_id=BOT_CHAT_ID)
+
+
 def main(time_intervall=SLEEP):
+    start_metrics_server()
     while True:
-        try:
-            print(time.strftime('%X %x %Z'))
-            getSniperStats()
-            sleep(time_intervall)
-        except:
-            print('Restart...')
-            sleep(time_intervall)
+        run_check(MONITOR)
+        sleep(time_intervall)
 
 
 if __name__ == '__main__':
@@ -1,12 +1,16 @@
-import requests
 from bs4 import BeautifulSoup
+from Functions.scraping_tools import get_response
 
 
 def get_soup(url):
-    res = requests.get(url)
-    if res.status_code != 200 or 'client has been blocked' in res.text:
-        res = requests.get(url, headers={"User-Agent": "Mozilla/5.0"})
-        if res.status_code != 200:
-            return 'RequestsError'
-    soup = BeautifulSoup(res.text, "html.parser")
+    '''
+    Returns the page as BeautifulSoup, built with the lxml parser (several times faster than html.parser).
+    For reading tables into typed rows Functions/html_tables.py skips the soup altogether.
+    '''
+    res = get_response(url)
+    if res != 'RequestsError' and 'client has been blocked' in res.text:
+        res = get_response(url, headers={"User-Agent": "Mozilla/5.0"})
+    if res == 'RequestsError':
+        return 'RequestsError'
+    soup = BeautifulSoup(res.content, "lxml")
     return soup
\ No newline at end of file
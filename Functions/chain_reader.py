@@ -0,0 +1,131 @@
+import os
+import time
+import threading
+from abc import ABC, abstractmethod
+import requests
+from Functions.scraping_tools import SESSION, get_data
+from Functions.rate_limiter import get_bucket
+from Functions.metrics import HTTP_REQUEST_SECONDS, HTTP_REQUESTS, get_host
+
+ETHERSCAN_URL = 'https://api.etherscan.io/api'
+TOTAL_SUPPLY  = '0x18160ddd'  # selector of totalSupply(), the number of tokens in existence of an erc721 contract
+
+
+class ContractCall:
+    '''
+    One eth_call of a view function without arguments. name is the key of its result, data the 4 byte selector
+    of the function. Results of constant calls (e.g. max supply) are read once and then kept by the reader.
+    '''
+
+    def __init__(self, name, to, data, constant=False):
+        self.name     = name
+        self.to       = to
+        self.data     = data
+        self.constant = constant
+
+    def __repr__(self):
+        return f"ContractCall({self.name!r})"
+
+
+def parse_result(result):
+    '''
+    returns the integer of a hex eth_call result, None for errors, empty results (e.g. reverted calls) and text
+    that is not hex (e.g. "Max rate limit reached" of etherscan)
+    '''
+    if not isinstance(result, str) or not result.startswith('0x') or result == '0x':
+        return None
+    try:
+        return int(result, 16)
+    except ValueError:
+        return None
+
+
+class ChainReader(ABC):
+    '''
+    Base of the chain read backends. read(calls) returns {call name: int or None if the call failed}. The
+    backends only implement eth_call_batch, the results of constant calls are cached here.
+    '''
+
+    def __init__(self):
+        self.constants = {}  # (to, data) -> result of a constant call
+        self.lock      = threading.Lock()
+
+    def read(self, calls):
+        with self.lock:
+            results = {call.name: self.constants[(call.to, call.data)] for call in calls if (call.to, call.data) in self.constants}
+        todo = [call for call in calls if call.name not in results]
+        for call, result in zip(todo, self.eth_call_batch(todo) if todo else []):
+            results[call.name] = result
+            if call.constant and result is not None:
+                with self.lock:
+                    self.constants[(call.to, call.data)] = result
+        return results
+
+    @abstractmethod
+    def eth_call_batch(self, calls):
+        '''returns the parsed results of the calls in the same order'''
+
+
+class JsonRpcReader(ChainReader):
+    '''
+    Sends all calls of a read as one JSON-RPC batch request to an ethereum node, e.g. a local node on
+    http://127.0.0.1:8545, so a read is one round trip no matter how many calls it has.
+    '''
+
+    def __init__(self, url):
+        super().__init__()
+        self.url = url
+
+    def eth_call_batch(self, calls):
+        batch = [
+            {'jsonrpc': '2.0', 'id': idx, 'method': 'eth_call', 'params': [{'to': call.to, 'data': call.data}, 'latest']}
+            for idx, call in enumerate(calls)
+        ]
+        host = get_host(self.url)
+        bucket = get_bucket(self.url)
+        bucket.acquire()
+        start = time.perf_counter()
+        try:
+            response = SESSION.post(self.url, json=batch, timeout=30)
+        except requests.RequestException as e:
+            HTTP_REQUESTS.inc(host=host, result='connection_error')
+            print(f"JSON-RPC Error {e!r}")
+            return [None] * len(calls)
+        HTTP_REQUEST_SECONDS.observe(time.perf_counter() - start, host=host, status=response.status_code)
+        bucket.on_response(response.status_code, response.headers.get('Retry-After'))
+        data = response.json() if response.status_code == 200 else None
+        if not isinstance(data, list):  # http error or one error object for the whole batch
+            HTTP_REQUESTS.inc(host=host, result='error')
+            print(f"JSON-RPC Error {response.status_code}: {response.text[:200]}")
+            return [None] * len(calls)
+        HTTP_REQUESTS.inc(host=host, result='ok')
+        # the responses of a batch can come in any order
+        results = {item.get('id'): item.get('result') for item in data}
+        return [parse_result(results.get(idx)) for idx in range(len(calls))]
+
+
+class EtherscanReader(ChainReader):
+    '''Fallback without a node: every call is a separate eth_call through the etherscan proxy api'''
+
+    def __init__(self, api_key):
+        super().__init__()
+        self.api_key = api_key
+
+    def eth_call_batch(self, calls):
+        results = []
+        for call in calls:
+            url = f"{ETHERSCAN_URL}?module=proxy&action=eth_call&to={call.to}&data={call.data}&tag=latest&apikey={self.api_key}"
+            data = get_data(url)
+            results.append(None if data == 'RequestsError' else parse_result(data.get('result')))
+        return results
+
+
+def get_chain_reader(rpc_url=None, etherscan_api_key=None):
+    '''
+    Returns the JSON-RPC reader of rpc_url (default: the ETH_RPC_URL environment variable) or the etherscan
+    reader if no endpoint is configured
+    '''
+    rpc_url = rpc_url or os.getenv('ETH_RPC_URL')  # read on creation, after the caller loaded its .env
+    if rpc_url:
+        return JsonRpcReader(rpc_url)
+    return EtherscanReader(etherscan_api_key)
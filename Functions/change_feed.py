@@ -0,0 +1,45 @@
+import os
+import time
+
+POLL_INTERVAL = 0.5  # seconds between two checks of a version stamp, only a tiny local file is read
+
+
+def get_version_path(str_file_path):
+    return str_file_path + '.version'
+
+
+def publish_version(str_file_path):
+    '''
+    Stamps a data file with a new version after it was written, so subscribers know it changed. The stamp is
+    written to a temporary file and moved in place, readers never see a half written version.
+    '''
+    version = time.time_ns()
+    version_path = get_version_path(str_file_path)
+    with open(version_path + '.tmp', 'w') as f:
+        f.write(str(version))
+    os.replace(version_path + '.tmp', version_path)
+    return version
+
+
+def read_version(str_file_path):
+    '''returns the current version stamp of a data file or None if it was never published'''
+    try:
+        with open(get_version_path(str_file_path), 'r') as f:
+            return int(f.read())
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+def wait_for_version(str_file_path, version, timeout=None, poll_interval=POLL_INTERVAL):
+    '''
+    Blocks until the version stamp of a data file differs from version and returns the new version. Returns the
+    old version if the timeout is over first.
+    '''
+    deadline = None if timeout is None else time.monotonic() + timeout
+    while True:
+        current = read_version(str_file_path)
+        if current != version:
+            return current
+        if deadline is not None and time.monotonic() >= deadline:
+            return version
+        time.sleep(poll_interval)
@@ -0,0 +1,158 @@
+import os
+import json
+import shutil
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from Functions.change_feed import publish_version, read_version
+from Functions.prices import gwei_array_to_eth
+
+DATA_PATH  = '../Data'
+STORE_NAME = 'processed'
+# float ETH price columns that are not stored, they are derived from their exact gwei column on load
+DERIVED_PRICES = {
+    "current_price":   "current_price_gwei",
+    "last_sale_price": "last_sale_price_gwei",
+}
+
+
+def get_collection_path(collection, data_path=DATA_PATH):
+    '''returns the partition directory of a collection, e.g. ../Data/processed/collection=clonex'''
+    return os.path.join(data_path, STORE_NAME, f'collection={collection}')
+
+
+def collection_exists(collection, data_path=DATA_PATH):
+    path = get_collection_path(collection, data_path)
+    return os.path.isdir(path) and any(file.endswith('.parquet') for file in os.listdir(path))
+
+
+def to_text(val):
+    '''serializes nested api fields (dicts, lists) to json so they fit in a typed string column'''
+    if val is None or (isinstance(val, float) and pd.isna(val)):
+        return None
+    if isinstance(val, str):
+        return val
+    if isinstance(val, (dict, list)):
+        return json.dumps(val, default=str)
+    return str(val)
+
+
+def to_storage_frame(df):
+    '''
+    Casts a processed collection to storable column types: trait columns become categoricals of their string
+    values, nested object columns become json strings, numeric and datetime columns are kept as they are. ETH
+    prices with a gwei column (DERIVED_PRICES) are dropped.
+    '''
+    df = df.reset_index(drop=True)
+    df = df.drop(columns=[eth for eth, gwei in DERIVED_PRICES.items() if eth in df and gwei in df])
+    for col in df.columns:
+        if col.startswith("Trait_"):
+            df[col] = df[col].astype(object).map(to_text).astype("category")
+        elif df[col].dtype == object:
+            df[col] = df[col].map(to_text)
+    return df
+
+
+def get_storage_schema(df):
+    '''
+    Derives the parquet schema from a storage frame. Object columns are always strings, so a chunk where a
+    column is empty gets the same schema as one where it is filled.
+    '''
+    fields = []
+    for col in df.columns:
+        if col.startswith("Trait_"):
+            fields.append(pa.field(col, pa.dictionary(pa.int32(), pa.string())))
+        elif df[col].dtype == object:
+            fields.append(pa.field(col, pa.string()))
+        elif pd.api.types.is_datetime64_any_dtype(df[col]):
+            fields.append(pa.field(col, pa.timestamp('ns')))
+        elif isinstance(df[col].dtype, pd.Int64Dtype): # gwei prices, nullable
+            fields.append(pa.field(col, pa.int64()))
+        else:
+            fields.append(pa.field(col, pa.from_numpy_dtype(df[col].dtype)))
+    return pa.schema(fields)
+
+
+class CollectionWriter:
+    '''
+    Writes a processed collection chunk by chunk as parquet parts into a temporary partition directory, which
+    replaces the stored version of the collection on close. All chunks are cast to the schema of the first one.
+    '''
+
+    def __init__(self, collection, data_path=DATA_PATH):
+        self.path     = get_collection_path(collection, data_path)
+        self.tmp_path = self.path + '.tmp'
+        self.schema   = None
+        self.parts    = 0
+        shutil.rmtree(self.tmp_path, ignore_errors=True)
+        os.makedirs(self.tmp_path)
+
+    def write(self, df):
+        df = to_storage_frame(df)
+        if self.schema is None:
+            self.schema = get_storage_schema(df)
+        df = df.reindex(columns=self.schema.names)
+        for field in self.schema:
+            if field.type == pa.string() and df[field.name].dtype != object:
+                df[field.name] = df[field.name].astype(object).map(to_text)
+        table = pa.Table.from_pandas(df, schema=self.schema, preserve_index=False)
+        pq.write_table(table, os.path.join(self.tmp_path, f'part-{self.parts:05d}.parquet'))
+        self.parts += 1
+
+    def close(self):
+        shutil.rmtree(self.path, ignore_errors=True)
+        os.replace(self.tmp_path, self.path)
+        publish_version(self.path)
+        return self.path
+
+
+def save_collection(df, collection, data_path=DATA_PATH):
+    '''
+    Writes a processed collection as parquet into its own partition directory and replaces the previous version.
+    '''
+    writer = CollectionWriter(collection, data_path)
+    writer.write(df)
+    return writer.close()
+
+
+def get_collection_version(collection, data_path=DATA_PATH):
+    '''
+    returns the version stamp published by the last write of a collection, partitions written before version
+    stamps fall back to the modification time of their newest file
+    '''
+    path = get_collection_path(collection, data_path)
+    version = read_version(path)
+    if version is None:
+        version = max(os.stat(os.path.join(path, file)).st_mtime_ns for file in os.listdir(path))
+    return version
+
+
+def get_stored_columns(collection, data_path=DATA_PATH):
+    path = get_collection_path(collection, data_path)
+    files = sorted(file for file in os.listdir(path) if file.endswith('.parquet'))
+    return pq.read_schema(os.path.join(path, files[0])).names
+
+
+def get_collection_columns(collection, data_path=DATA_PATH):
+    '''returns the column names of a collection including the derived ETH prices without reading any data'''
+    columns = []
+    for col in get_stored_columns(collection, data_path):
+        columns += [eth for eth, gwei in DERIVED_PRICES.items() if gwei == col]
+        columns.append(col)
+    return list(dict.fromkeys(columns))
+
+
+def load_collection(collection, columns=None, data_path=DATA_PATH):
+    '''
+    Reads a processed collection. If columns is given only these columns are read from disk, an ETH price of
+    DERIVED_PRICES is computed from its gwei column.
+    '''
+    stored = get_stored_columns(collection, data_path)
+    read_columns = None
+    if columns is not None:
+        read_columns = list(dict.fromkeys(col if col in stored else DERIVED_PRICES.get(col, col) for col in columns))
+    df = pd.read_parquet(get_collection_path(collection, data_path), columns=read_columns)
+    for eth, gwei in DERIVED_PRICES.items():
+        if eth not in df and gwei in df and (columns is None or eth in columns):
+            df[eth] = gwei_array_to_eth(df[gwei])
+    return df if columns is None else df[columns]
@@ -0,0 +1,107 @@
+import json
+import time
+import asyncio
+import aiohttp
+from Functions.rate_limiter import get_bucket
+from Functions.http_cache import get_http_cache, get_cache_key, get_cache_ttl
+from Functions.metrics import HTTP_REQUEST_SECONDS, HTTP_REQUESTS, RATE_LIMIT_WAIT_SECONDS, get_host
+
+DEFAULT_CONCURRENCY = 6
+MAX_RETRIES         = 4
+
+
+def get_async_session(concurrency=DEFAULT_CONCURRENCY):
+    '''
+    Returns one aiohttp session whose connector keeps up to `concurrency` connections alive and reuses them
+    for all requests of a crawl, so every host only pays the TLS handshake once per connection.
+    '''
+    connector = aiohttp.TCPConnector(limit=concurrency, limit_per_host=concurrency, ttl_dns_cache=300)
+    timeout = aiohttp.ClientTimeout(total=60)
+    return aiohttp.ClientSession(connector=connector, timeout=timeout)
+
+
+async def fetch_json(session, url, params=None, headers=None, cache_ttl=None):
+    '''
+    Performs a rate limited async HTTP GET request on the pooled session, waiting for Retry-After and retrying
+    on 429. Fresh responses of the on-disk http cache are returned without a request (cache_ttl seconds, default
+    per endpoint), only bodies that parse as json are stored. Returns the response as dict or None on errors and
+    blocked (non-json) responses.
+    '''
+    host  = get_host(url)
+    cache = get_http_cache()
+    ttl   = get_cache_ttl(url) if cache_ttl is None else cache_ttl
+    key   = get_cache_key(url, params)
+    if cache and ttl > 0:
+        cached = cache.get(key)
+        if cached and cached.is_fresh():
+            try:
+                data = cached.json()
+                HTTP_REQUESTS.inc(host=host, result='cached')
+                return data
+            except ValueError:  # a blocked page stored by an older version, fetch it again
+                pass
+
+    bucket = get_bucket(url, (headers or {}).get('X-API-KEY'))
+    for _ in range(MAX_RETRIES):
+        with RATE_LIMIT_WAIT_SECONDS.time(host=host):
+            await bucket.acquire_async()
+        start = time.perf_counter()
+        try:
+            async with session.get(url, params=params, headers=headers) as response:
+                bucket.on_response(response.status, response.headers.get('Retry-After'))
+                if response.status == 200:
+                    content = await response.read()
+                    HTTP_REQUEST_SECONDS.observe(time.perf_counter() - start, host=host, status=response.status)
+                    try:
+                        data = json.loads(content)
+                    except ValueError:
+                        # opensea answers blocked clients with an html page and status 200, never cache it
+                        HTTP_REQUESTS.inc(host=host, result='blocked')
+                        print(f"Blocked request, no json from {url}")
+                        return None
+                    HTTP_REQUESTS.inc(host=host, result='ok')
+                    if cache and ttl > 0:
+                        cache.put(key, response.status, dict(response.headers), content, ttl)
+                    return data
+                HTTP_REQUEST_SECONDS.observe(time.perf_counter() - start, host=host, status=response.status)
+                HTTP_REQUESTS.inc(host=host, result='rate_limited' if response.status == 429 else 'error')
+                if response.status != 429:
+                    print(f"Error {response.status} occured")
+                    print(await response.text())
+                    return None
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            HTTP_REQUESTS.inc(host=host, result='connection_error')
+            raise
+    print(f"Error 429 occured {MAX_RETRIES} times for {url}")
+    return None
+
+
+async def crawl(jobs, fetch, concurrency=DEFAULT_CONCURRENCY):
+    '''
+    Async generator that runs `await fetch(session, job)` for every job on one shared session with at most
+    `concurrency` requests in flight. Yields (job, result) tuples in completion order as soon as they arrive,
+    result is None if the request failed on connection level or its body could not be decoded.
+    '''
+    jobs = iter(jobs)
+    async with get_async_session(concurrency) as session:
+        pending = {}
+
+        def schedule():
+            for job in jobs:
+                task = asyncio.ensure_future(fetch(session, job))
+                pending[task] = job
+                if len(pending) >= concurrency:
+                    return
+
+        schedule()
+        while pending:
+            done, _ = await asyncio.wait(pending.keys(), return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                job = pending.pop(task)
+                try:
+                    result = task.result()
+                except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+                    print(f"Error {e!r} occured")
+                    result = None
+                yield job, result
+            schedule()
@@ -0,0 +1,39 @@
+import pandas as pd
+
+
+class DashboardData:
+    '''
+    Read-only view of a processed collection for the dashboard. The frame is indexed by token_id and the floors
+    and the values of every trait are computed once, so the dashboard only looks them up on a rerun. A token can
+    have several rows (e.g. several sell orders), the listings are joined with its first row.
+    '''
+
+    def __init__(self, df):
+        df = df.copy()
+        df["token_id"] = df["token_id"].astype(int)
+        df.index = pd.Index(df["token_id"].to_numpy())
+        self.df     = df
+        self.tokens = df[~df.index.duplicated()] # one row per token_id for the listings lookup
+        self.traits = list(df.columns[df.columns.str.contains("Trait")]) # get extracted traits
+
+        df_fixed_price_listings = df[df["payment_token_sell_order"]=="ETH"]
+        self.floors = {
+            trait: df_fixed_price_listings.groupby(trait, observed=True)["current_price"].min().to_dict()
+            for trait in self.traits
+        }
+        self.trait_values = {trait: list(df[trait].dropna().unique()) for trait in self.traits}
+
+    def join_listings(self, df_listings):
+        '''
+        Adds the collection data of the listed tokens to the listings like an inner merge on token_id, but every
+        token is looked up in the index and the listings keep their order (newest first).
+        '''
+        df_listings = df_listings[df_listings["token_id"].isin(self.tokens.index)].reset_index(drop=True)
+        columns = [col for col in self.tokens.columns if col not in df_listings.columns]
+        df_tokens = self.tokens.reindex(df_listings["token_id"].to_numpy())[columns].reset_index(drop=True)
+        return pd.concat([df_listings, df_tokens], axis=1)
+
+    def filter_trait(self, trait, trait_value):
+        if trait_value:
+            return self.df[self.df[trait]==trait_value]
+        return self.df
@@ -0,0 +1,113 @@
+import os
+from collections import deque
+from datetime import datetime, timezone
+from Functions.scraping_tools import get_response
+from Functions.file_handler import save_pickle, load_pickle
+
+OPENSEA_EVENTS_URL = 'https://api.opensea.io/api/v1/events'
+PAGE_LIMIT         = 50
+MAX_PAGES          = 20    # pages read per poll, older events are skipped after a long downtime
+SEEN_SIZE          = 2000  # event keys remembered to drop events that are returned twice
+OVERLAP            = 120   # seconds requested before the watermark, so events indexed late by opensea are not missed
+
+
+def get_event_time(event):
+    '''returns the unix timestamp of an opensea event (event_timestamp is UTC without offset)'''
+    timestamp = datetime.fromisoformat(event['event_timestamp'])
+    return timestamp.replace(tzinfo=timezone.utc).timestamp()
+
+
+def get_event_key(event):
+    '''(token_id, transaction hash) of an event, falls back to the event id for events without a transaction'''
+    token_id    = (event.get('asset') or {}).get('token_id')
+    transaction = (event.get('transaction') or {}).get('transaction_hash')
+    return token_id, transaction or event['id']
+
+
+class EventFeed:
+    '''
+    Polls the opensea events endpoint of one collection and event type and returns only events that were not
+    returned before. The newest event time is kept as watermark, every poll only requests events after it and
+    pages with the cursor until it is reached. Events up to the watermark of the first poll (start) happened
+    before the feed was started and are never returned. Watermark, start and seen keys are loaded from state_file
+    once and saved after a poll that found new events.
+    '''
+
+    def __init__(self, collection, event_type, state_file=None, api_key=None):
+        api_key = api_key or os.getenv('OPENSEA_APIKEY')  # read on creation, after the caller loaded its .env
+        self.collection = collection
+        self.event_type = event_type
+        self.state_file = state_file
+        self.headers    = {'X-API-KEY': api_key} if api_key else None
+        self.watermark  = None
+        self.start      = None
+        self.seen_keys  = deque(maxlen=SEEN_SIZE)
+        self.seen       = set()
+        if state_file:
+            state = load_pickle(state_file)
+            if isinstance(state, dict) and 'watermark' in state:
+                self.watermark = state['watermark']
+                self.start     = state.get('start')
+                self._remember(state['seen'])
+
+    def _remember(self, keys):
+        for key in keys:
+            if key in self.seen:
+                continue
+            if len(self.seen_keys) == self.seen_keys.maxlen:
+                self.seen.discard(self.seen_keys[0])
+            self.seen_keys.append(key)
+            self.seen.add(key)
+
+    def _get_page(self, cursor=None):
+        querystring = {
+            'collection_slug': self.collection,
+            'event_type':      self.event_type,
+            'only_opensea':    'false',
+            'limit':           f'{PAGE_LIMIT}',
+        }
+        if self.watermark is not None:
+            querystring['occurred_after'] = f'{int(self.watermark - OVERLAP)}'
+        if cursor:
+            querystring['cursor'] = cursor
+        response = get_response(OPENSEA_EVENTS_URL, params=querystring, headers=self.headers)
+        if response == 'RequestsError' or response.status_code != 200:
+            return None
+        return response.json()
+
+    def _is_new(self, event):
+        if get_event_key(event) in self.seen:
+            return False
+        return self.start is None or get_event_time(event) > self.start
+
+    def poll(self, include_first_page=False):
+        '''
+        Returns the new events since the last poll, oldest first. The first poll without a stored watermark
+        only reads the newest page to set watermark and start and returns no events, so a new state file does not
+        replay old events, also not the older events of the overlap window. include_first_page returns the events
+        of that page anyway, e.g. to seed a store, they are still never returned again. Returns an empty list if
+        the request was blocked.
+        '''
+        first_poll = self.watermark is None
+        events, cursor = [], None
+        for _ in range(MAX_PAGES):
+            page = self._get_page(cursor)
+            if page is None:
+                break
+            new_events = [event for event in page['asset_events'] if self._is_new(event)]
+            events += new_events
+            cursor = page.get('next')
+            # the first page without new events means everything older was seen already
+            if not cursor or not new_events or first_poll:
+                break
+        if not events:
+            return []
+
+        events.reverse()
+        self._remember(get_event_key(event) for event in events)
+        self.watermark = max([self.watermark or 0] + [get_event_time(event) for event in events])
+        if first_poll:
+            self.start = self.watermark
+        if self.state_file:
+            save_pickle({'watermark': self.watermark, 'start': self.start, 'seen': list(self.seen_keys)}, self.state_file)
+        return [] if first_poll and not include_first_page else events
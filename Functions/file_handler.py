@@ -39,3 +39,60 @@ def load_json(str_file_path):
     else:
         dict_tmp = {'Error': 'File does not exist'}
         return dict_tmp
+
+
+def save_json_array(items, str_file_path):
+    '''
+    Writes the items of an iterable as one json array item by item, so they never have to be in memory at once.
+    The file is written next to the target and moved in place, it can be a patched copy of the file that is read
+    while writing. Returns the number of items.
+    '''
+    count = 0
+    with open(str_file_path + '.tmp', 'w') as f:
+        f.write('[')
+        for item in items:
+            if count:
+                f.write(', ')
+            json.dump(item, f)
+            count += 1
+        f.write(']')
+    os.replace(str_file_path + '.tmp', str_file_path)
+    return count
+
+
+def iter_json_array(str_file_path, chunk_size=1 << 16):
+    '''
+    Yields the items of a json file that holds one top level array one by one, reading the file in chunks
+    so the whole array is never loaded at once
+    '''
+    decoder = json.JSONDecoder()
+    with open(str_file_path, 'r') as f:
+        buffer, started, eof = '', False, False
+        while True:
+            buffer = buffer.lstrip()
+            if buffer and not started:
+                if buffer[0] != '[':
+                    raise ValueError(f'{str_file_path} does not contain a json array')
+                buffer, started = buffer[1:], True
+                continue
+            if buffer[:1] == ',':
+                buffer = buffer[1:]
+                continue
+            if buffer[:1] == ']':
+                return
+            if buffer:
+                try:
+                    item, end = decoder.raw_decode(buffer)
+                except json.JSONDecodeError:
+                    if eof:
+                        raise
+                else:
+                    if end < len(buffer) or eof: # a number at the end of the buffer might continue in the file
+                        buffer = buffer[end:]
+                        yield item
+                        continue
+            elif eof:
+                raise ValueError(f'{str_file_path} ends before the json array is closed')
+            more = f.read(chunk_size)
+            eof = not more
+            buffer += more
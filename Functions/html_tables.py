@@ -0,0 +1,70 @@
+import re
+from lxml import etree
+
+# selectors that are read straight from the cells of a row instead of evaluating an xpath:
+# td[2] (text of the 2nd cell), td[5]//a/@href (attribute of the first a in the 5th cell), td[5]/@class
+SIMPLE_SELECTOR = re.compile(r'^td\[(\d+)\](?://(\w+))?(?:/@([\w-]+))?$')
+
+
+class Column:
+    '''one column of a table schema: where its text is in a row and how it is parsed'''
+
+    def __init__(self, name, selector, parse=str):
+        self.name   = name
+        self.parse  = parse
+        self.xpath  = None
+        match = SIMPLE_SELECTOR.match(selector)
+        if match:
+            self.cell      = int(match.group(1)) - 1
+            self.tag       = match.group(2)
+            self.attribute = match.group(3)
+        else:
+            self.cell  = -1
+            self.xpath = etree.XPath(f'string({selector})')
+
+    def get_text(self, row, cells):
+        if self.xpath is not None:
+            return self.xpath(row)
+        element = cells[self.cell]
+        if self.tag:
+            element = next(element.iter(self.tag), None)
+            if element is None:
+                return ''
+        if self.attribute:
+            return element.get(self.attribute, '')
+        if len(element) == 0:
+            return element.text or ''
+        return ''.join(element.itertext())
+
+
+def compile_schema(schema):
+    '''
+    Compiles a schema {column: (selector, parse)} into columns. selector is an xpath relative to the row, e.g.
+    'td[2]' for the text of the second cell or 'td[5]//a/@href' for the link in the fifth. Selectors of that form
+    are read directly from the cells, others are evaluated as xpath. parse converts the text into the column
+    type, e.g. float.
+    '''
+    return [Column(name, selector, parse) for name, (selector, parse) in schema.items()]
+
+
+def iter_table_rows(content, schema):
+    '''
+    Yields one dict per table row of the html in content with the columns of schema (a dict or compiled once
+    with compile_schema), typed by their parse functions. The page is parsed once by lxml's C parser and the
+    cells are read by index, rows with fewer cells than the schema needs (e.g. a header with th cells) are skipped.
+    '''
+    columns = compile_schema(schema) if isinstance(schema, dict) else schema
+    min_cells = max(column.cell for column in columns) + 1
+    doc = etree.HTML(content)
+    if doc is None:
+        return
+    for row in doc.iter('tr'):
+        cells = row.findall('td')
+        if len(cells) < min_cells:
+            continue
+        yield {column.name: column.parse(column.get_text(row, cells).strip()) for column in columns}
+
+
+def get_table_rows(content, schema, key):
+    '''reads the rows of iter_table_rows into {row[key]: row}, key is usually a link that identifies the row'''
+    return {row[key]: row for row in iter_table_rows(content, schema)}
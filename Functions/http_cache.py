@@ -0,0 +1,169 @@
+import os
+import time
+import json
+import sqlite3
+import threading
+from urllib.parse import urlparse
+import requests
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+
+# set HTTP_CACHE_PATH to an empty string to disable the cache
+CACHE_PATH     = os.getenv('HTTP_CACHE_PATH', os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Data', 'http_cache.sqlite'))
+MAX_CACHE_SIZE = 256 * 1024 * 1024  # bytes of response bodies kept, least recently used responses are evicted first
+
+# seconds a response is served from disk without asking the server, per (host, path prefix), first match wins.
+# Responses of other endpoints are only stored if the server sends an ETag or Last-Modified to revalidate them.
+CACHE_TTLS = [
+    ('api.opensea.io',    '/api/v1/events',      0),     # the event feeds need every new event
+    ('api.opensea.io',    '/api/v1/collection/', 30),    # collection stats
+    ('api.opensea.io',    '/api/v1/assets',      600),   # asset pages, a restarted scrape reads them from disk
+    ('api.coingecko.com', '/',                   60),
+    ('api.etherscan.io',  '/',                   0),     # balances and contract reads
+]
+
+_CACHE      = None
+_CACHE_LOCK = threading.Lock()
+
+
+def get_cache_ttl(url):
+    parsed = urlparse(url)
+    for host, path, ttl in CACHE_TTLS:
+        if parsed.netloc == host and parsed.path.startswith(path):
+            return ttl
+    return 0
+
+
+def is_api_url(url):
+    '''True for the json apis of CACHE_TTLS, their responses are only stored if the body is json'''
+    parsed = urlparse(url)
+    return any(parsed.netloc == host and parsed.path.startswith(path) for host, path, _ in CACHE_TTLS)
+
+
+def is_json(content):
+    '''False for bodies that do not parse, e.g. the html page opensea sends with status 200 to blocked clients'''
+    try:
+        json.loads(content)
+        return True
+    except ValueError:
+        return False
+
+
+def get_cache_key(url, params=None):
+    '''the full url with query string, the same for a request given as url with params or as prepared url'''
+    return requests.Request('GET', url, params=params).prepare().url
+
+
+class CachedResponse:
+    '''a stored response with its validators and the time until it is fresh'''
+
+    def __init__(self, key, status_code, headers, content, expires_at):
+        self.key         = key
+        self.status_code = status_code
+        self.headers     = headers
+        self.content     = content
+        self.expires_at  = expires_at
+
+    def is_fresh(self):
+        return time.time() < self.expires_at
+
+    def get_validators(self):
+        '''conditional request headers to revalidate the stored response'''
+        validators = {}
+        if 'ETag' in self.headers:
+            validators['If-None-Match'] = self.headers['ETag']
+        if 'Last-Modified' in self.headers:
+            validators['If-Modified-Since'] = self.headers['Last-Modified']
+        return validators
+
+    def to_response(self):
+        '''rebuilds a requests.Response, so callers can not tell it from a fetched one except by from_cache'''
+        response = requests.Response()
+        response.status_code = self.status_code
+        response.headers     = CaseInsensitiveDict(self.headers)
+        response._content    = self.content
+        response.encoding    = get_encoding_from_headers(response.headers)
+        response.url         = self.key
+        response.from_cache  = True
+        return response
+
+    def json(self):
+        return json.loads(self.content)
+
+
+class HTTPCache:
+    '''
+    Size bounded on-disk response cache in sqlite, shared by all threads and processes that use the same file.
+    '''
+
+    def __init__(self, path=CACHE_PATH, max_size=MAX_CACHE_SIZE):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.max_size = max_size
+        self.lock     = threading.Lock()
+        self.db       = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute('''
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY, status_code INTEGER, headers TEXT, content BLOB,
+                expires_at REAL, last_access REAL, size INTEGER
+            )''')
+        self.db.execute('CREATE INDEX IF NOT EXISTS responses_last_access ON responses (last_access)')
+        self.db.commit()
+
+    def get(self, key):
+        with self.lock:
+            row = self.db.execute(
+                'SELECT status_code, headers, content, expires_at FROM responses WHERE key = ?', (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            self.db.execute('UPDATE responses SET last_access = ? WHERE key = ?', (time.time(), key))
+            self.db.commit()
+        status_code, headers, content, expires_at = row
+        return CachedResponse(key, status_code, json.loads(headers), content, expires_at)
+
+    def put(self, key, status_code, headers, content, ttl):
+        headers = {name: value for name, value in headers.items() if name.lower() != 'content-encoding'}
+        with self.lock:
+            self.db.execute(
+                'INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (key, status_code, json.dumps(headers), content, time.time() + ttl, time.time(), len(content))
+            )
+            self.db.commit()
+            self._evict()
+
+    def refresh(self, key, ttl):
+        '''marks a stored response as fresh again after the server confirmed it with 304 Not Modified'''
+        with self.lock:
+            now = time.time()
+            self.db.execute('UPDATE responses SET expires_at = ?, last_access = ? WHERE key = ?', (now + ttl, now, key))
+            self.db.commit()
+
+    def _evict(self):
+        size = self.db.execute('SELECT COALESCE(SUM(size), 0) FROM responses').fetchone()[0]
+        if size <= self.max_size:
+            return
+        # drop the least recently used responses until the cache is at 90% of its size
+        evicted = 0
+        for key, entry_size in self.db.execute('SELECT key, size FROM responses ORDER BY last_access').fetchall():
+            if size - evicted <= self.max_size * 0.9:
+                break
+            self.db.execute('DELETE FROM responses WHERE key = ?', (key,))
+            evicted += entry_size
+        self.db.commit()
+
+    def clear(self):
+        with self.lock:
+            self.db.execute('DELETE FROM responses')
+            self.db.commit()
+
+
+def get_http_cache():
+    '''returns the process-wide cache, opened on first use, None if it is disabled'''
+    global _CACHE
+    if not CACHE_PATH:
+        return None
+    with _CACHE_LOCK:
+        if _CACHE is None:
+            _CACHE = HTTPCache(CACHE_PATH)
+        return _CACHE
@@ -0,0 +1,31 @@
+import numpy as np
+import pandas as pd
+from Functions.prices import to_gwei_array, gwei_array_to_eth
+
+LISTING_COLUMNS = [
+    "token_id", "event_type", "created_date", "starting_price", "ending_price", "payment_token_symbol",
+    "starting_price_gwei", "ending_price_gwei",
+]
+
+
+def decode_listing_events(asset_events):
+    '''
+    Decodes created events of the opensea events endpoint into a typed pd.Dataframe of listings with the columns
+    of LISTING_COLUMNS. Only the needed fields are read from every event, bundle listings without a single asset
+    are skipped. The order of the events is kept. Prices are exact integer gwei in the *_gwei columns and float ETH
+    in starting_price and ending_price.
+    '''
+    asset_events = [event for event in asset_events if event.get("asset")]
+    count = len(asset_events)
+    starting_price_gwei = to_gwei_array([event["starting_price"] for event in asset_events])
+    ending_price_gwei = to_gwei_array([event["ending_price"] for event in asset_events])
+    return pd.DataFrame({
+        "token_id":             np.fromiter((int(event["asset"]["token_id"]) for event in asset_events), dtype=np.int64, count=count),
+        "event_type":           np.array([event["event_type"] for event in asset_events], dtype=object),
+        "created_date":         pd.to_datetime([event["created_date"] for event in asset_events]),
+        "starting_price":       gwei_array_to_eth(starting_price_gwei),
+        "ending_price":         gwei_array_to_eth(ending_price_gwei),
+        "payment_token_symbol": np.array([(event["payment_token"] or {}).get("symbol") for event in asset_events], dtype=object),
+        "starting_price_gwei":  starting_price_gwei,
+        "ending_price_gwei":    ending_price_gwei,
+    }, columns=LISTING_COLUMNS)
@@ -0,0 +1,188 @@
+import os
+import time
+import threading
+from contextlib import contextmanager
+from urllib.parse import urlparse
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+# port of the /metrics endpoint, set METRICS_PORT to an empty string to disable it
+METRICS_PORT    = os.getenv('METRICS_PORT', '9108')
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)       # seconds
+LAG_BUCKETS     = (1, 2, 5, 10, 15, 30, 60, 120, 300, 600, 1800, 3600)                       # seconds
+
+_REGISTRY    = []
+_SERVER      = None
+_SERVER_LOCK = threading.Lock()
+
+
+def get_host(url):
+    return urlparse(url).netloc
+
+
+def escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def format_labels(labelnames, values):
+    if not labelnames:
+        return ''
+    return '{' + ','.join(f'{name}="{escape_label(value)}"' for name, value in zip(labelnames, values)) + '}'
+
+
+class Metric:
+    '''one metric family with a value per combination of label values, thread-safe'''
+    type = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name          = name
+        self.documentation = documentation
+        self.labelnames    = tuple(labelnames)
+        self.values        = {}  # label values -> value
+        self.lock          = threading.Lock()
+        _REGISTRY.append(self)
+
+    def _key(self, labels):
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.type}']
+        with self.lock:
+            for key, value in sorted(self.values.items()):
+                lines += self._render_value(key, value)
+        return lines
+
+    def _render_value(self, key, value):
+        return [f'{self.name}{format_labels(self.labelnames, key)} {value}']
+
+
+class Counter(Metric):
+    type = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    type = 'gauge'
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self.lock:
+            self.values[key] = value
+
+
+class Histogram(Metric):
+    '''cumulative bucket counts, sum and count per label values like a prometheus histogram'''
+    type = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self.lock:
+            counts = self.values.get(key)
+            if counts is None:
+                counts = self.values[key] = [[0] * len(self.buckets), 0.0, 0]  # bucket counts, sum, count
+            for idx, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[0][idx] += 1
+            counts[1] += value
+            counts[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        '''observes the seconds the with block took, also if it raised'''
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def _render_value(self, key, value):
+        bucket_counts, total, count = value
+        names = self.labelnames + ('le',)
+        lines = [
+            f'{self.name}_bucket{format_labels(names, key + (bound,))} {bucket_count}'
+            for bound, bucket_count in zip(self.buckets, bucket_counts)
+        ]
+        lines.append(f'{self.name}_bucket{format_labels(names, key + ("+Inf",))} {count}')
+        lines.append(f'{self.name}_sum{format_labels(self.labelnames, key)} {total}')
+        lines.append(f'{self.name}_count{format_labels(self.labelnames, key)} {count}')
+        return lines
+
+
+# HTTP helpers (Functions/scraping_tools.py, Functions/crawler.py)
+HTTP_REQUEST_SECONDS    = Histogram('http_request_seconds', 'Latency of HTTP requests by host and status code', ['host', 'status'])
+HTTP_REQUESTS           = Counter(
+    'http_requests_total', 'HTTP requests by host and result: ok, cached, not_modified, rate_limited, error, '
+    'connection_error or blocked (html instead of json)', ['host', 'result'])
+RATE_LIMIT_WAIT_SECONDS = Histogram('rate_limit_wait_seconds', 'Time spent waiting for the rate limit bucket of a host', ['host'])
+
+# telegram delivery queue (Functions/telegram_queue.py)
+TELEGRAM_SEND_SECONDS  = Histogram('telegram_send_seconds', 'Latency of telegram sendMessage calls by status code', ['status'])
+TELEGRAM_SENDS         = Counter('telegram_sends_total', 'Telegram sendMessage calls by result: sent, retried or failed', ['result'])
+TELEGRAM_QUEUE_SECONDS = Histogram('telegram_queue_seconds', 'Time messages waited in the delivery queue', buckets=LAG_BUCKETS)
+ALERT_LAG_SECONDS      = Histogram(
+    'alert_lag_seconds', 'Time from the event an alert is about (e.g. listing created_date) until it was sent',
+    ['chat'], buckets=LAG_BUCKETS)
+
+# monitor loops (Functions/monitor.py)
+CHECK_SECONDS = Histogram('check_seconds', 'Run time of monitor checks', ['monitor'])
+CHECK_ERRORS  = Counter('check_errors_total', 'Monitor checks that raised an exception', ['monitor'])
+LOOP_DRIFT    = Gauge('loop_drift_seconds', 'Seconds the last check started later than scheduled', ['monitor'])
+LAST_CHECK    = Gauge('last_check_timestamp_seconds', 'Unix time the last check of a monitor finished', ['monitor'])
+
+# listing poller (Opensea_Scrape/scrape_new_listings.py)
+LISTING_LAG_SECONDS = Histogram(
+    'listing_lag_seconds', 'Time from listing created_date until it is in the rolling listing store', ['collection'],
+    buckets=LAG_BUCKETS)
+
+
+def render():
+    '''all metrics in the prometheus text exposition format'''
+    lines = []
+    for metric in _REGISTRY:
+        lines += metric.render()
+    return '\n'.join(lines) + '\n'
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        if self.path.split('?')[0] not in ('/', '/metrics'):
+            self.send_error(404)
+            return
+        body = render().encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_metrics_server(port=METRICS_PORT):
+    '''
+    Serves the metrics of this process on http://127.0.0.1:<port>/metrics from a daemon thread, once per process.
+    Returns the server or None if it is disabled or the port is taken (e.g. by another alert process).
+    '''
+    global _SERVER
+    if not port:
+        return None
+    with _SERVER_LOCK:
+        if _SERVER is None:
+            try:
+                _SERVER = ThreadingHTTPServer(('127.0.0.1', int(port)), MetricsHandler)
+            except OSError as e:
+                print(f"Metrics endpoint not started on port {port}: {e}")
+                return None
+            _SERVER.daemon_threads = True
+            threading.Thread(target=_SERVER.serve_forever, name='metrics', daemon=True).start()
+            print(f"Metrics on http://127.0.0.1:{port}/metrics")
+        return _SERVER
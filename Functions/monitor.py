@@ -0,0 +1,97 @@
+import asyncio
+import importlib
+import traceback
+import time
+from concurrent.futures import ThreadPoolExecutor
+from Functions.metrics import CHECK_SECONDS, CHECK_ERRORS, LOOP_DRIFT, LAST_CHECK
+
+MAX_WORKERS = 32   # blocking checks running at the same time, matches the pool size of the shared session
+STAGGER     = 0.5  # seconds between the first runs of two monitors (within one interval), so they do not all fire at once
+
+
+class Monitor:
+    '''
+    Plugin description of one alert: a check function that is run every `interval` seconds. The check is either
+    a plain function (run in the daemon's thread pool) or a coroutine function (awaited on the event loop).
+    '''
+
+    def __init__(self, name, collection, interval, check, chat_id=None):
+        self.name       = name
+        self.collection = collection
+        self.interval   = interval
+        self.check      = check
+        self.chat_id    = chat_id
+
+    def __repr__(self):
+        return f"Monitor({self.name!r}, collection={self.collection!r}, interval={self.interval})"
+
+
+def load_monitors(module_names):
+    '''
+    Imports the given alert modules and returns their monitors. A module registers itself with a module level
+    MONITOR or a list MONITORS.
+    '''
+    monitors = []
+    for module_name in module_names:
+        module = importlib.import_module(module_name)
+        monitors += getattr(module, 'MONITORS', None) or [module.MONITOR]
+    return monitors
+
+
+def on_check_error(monitor):
+    CHECK_ERRORS.inc(monitor=monitor.name)
+    traceback.print_exc()
+    print(f'{monitor.name}: Restart...')
+
+
+def run_check(monitor):
+    '''
+    Runs the plain check of a monitor once in the calling thread. Its run time and errors are recorded in the
+    metrics, a failing check is logged instead of raised.
+    '''
+    print(time.strftime('%X %x %Z'), monitor.name)
+    try:
+        with CHECK_SECONDS.time(monitor=monitor.name):
+            monitor.check()
+    except Exception:
+        on_check_error(monitor)
+    LAST_CHECK.set(time.time(), monitor=monitor.name)
+
+
+async def run_check_async(monitor):
+    '''same as run_check for a coroutine check'''
+    print(time.strftime('%X %x %Z'), monitor.name)
+    try:
+        with CHECK_SECONDS.time(monitor=monitor.name):
+            await monitor.check()
+    except Exception:
+        on_check_error(monitor)
+    LAST_CHECK.set(time.time(), monitor=monitor.name)
+
+
+async def run_monitor(monitor, executor, delay=0):
+    '''
+    runs the check of one monitor forever, a failing check is logged and retried after the interval. How late
+    every run starts compared to its schedule (a full thread pool, a blocked event loop) is kept as loop drift.
+    '''
+    loop = asyncio.get_running_loop()
+    scheduled = loop.time() + delay
+    await asyncio.sleep(delay)
+    while True:
+        started = loop.time()
+        LOOP_DRIFT.set(max(started - scheduled, 0), monitor=monitor.name)
+        if asyncio.iscoroutinefunction(monitor.check):
+            await run_check_async(monitor)
+        else:
+            await loop.run_in_executor(executor, run_check, monitor)
+        scheduled = started + monitor.interval
+        await asyncio.sleep(max(scheduled - loop.time(), 0))
+
+
+async def run_monitors(monitors, max_workers=MAX_WORKERS):
+    '''runs all monitors concurrently on the current event loop'''
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        await asyncio.gather(*(
+            run_monitor(monitor, executor, delay=(idx * STAGGER) % monitor.interval)
+            for idx, monitor in enumerate(monitors)
+        ))
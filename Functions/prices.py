@@ -0,0 +1,65 @@
+from decimal import Decimal
+import numpy as np
+import pandas as pd
+
+# prices are kept as integer gwei: exact to compare and add, fit into int64 up to 9.2 billion ETH
+WEI_PER_GWEI = 1000000000
+GWEI_PER_ETH = 1000000000
+WEI_PER_ETH  = WEI_PER_GWEI * GWEI_PER_ETH
+GWEI_DTYPE   = "Int64"  # nullable, assets without a price stay <NA>
+
+
+def to_wei(wei):
+    '''parses a wei amount, the api sends integers as strings, sometimes with decimals ("8e16", "80000.000")'''
+    if isinstance(wei, int):
+        return wei
+    return int(Decimal(str(wei)))
+
+
+def wei_to_gwei(wei, quantity=1):
+    '''
+    Converts a wei amount as the api sends it (decimal string or int) into integer gwei per item, exactly in
+    integer arithmetic and rounded down to whole gwei. Returns None for missing amounts.
+    '''
+    if wei is None or (isinstance(wei, float) and np.isnan(wei)):
+        return None
+    return to_wei(wei) // (WEI_PER_GWEI * int(quantity or 1))
+
+
+def eth_to_gwei(eth):
+    '''Converts an ETH amount (e.g. a threshold from a config) into integer gwei without float rounding'''
+    return int(Decimal(str(eth)) * GWEI_PER_ETH)
+
+
+def gwei_to_eth(gwei):
+    return gwei / GWEI_PER_ETH
+
+
+def wei_to_eth(wei):
+    '''
+    Converts a wei amount to float ETH. The integer division is exact up to the final rounding to float, unlike
+    float(wei) / 1e18 which rounds twice.
+    '''
+    if wei is None:
+        return np.nan
+    return to_wei(wei) / WEI_PER_ETH
+
+
+def format_eth(wei):
+    '''formats a wei amount as exact ETH decimal string, e.g. "0.08"'''
+    eth = (Decimal(to_wei(wei)) / WEI_PER_ETH).normalize()
+    return f"{eth:f}"
+
+
+def to_gwei_array(wei_values, quantities=None):
+    '''converts a column of wei amounts (and optional quantities per amount) into a nullable int64 gwei array'''
+    if quantities is None:
+        gwei = [wei_to_gwei(wei) for wei in wei_values]
+    else:
+        gwei = [wei_to_gwei(wei, quantity) for wei, quantity in zip(wei_values, quantities)]
+    return pd.array(gwei, dtype=GWEI_DTYPE)
+
+
+def gwei_array_to_eth(gwei_values):
+    '''float ETH of a gwei column for display and plotting, <NA> becomes NaN'''
+    return pd.Series(gwei_values).to_numpy(dtype="float64", na_value=np.nan) / GWEI_PER_ETH
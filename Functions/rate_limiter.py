@@ -0,0 +1,101 @@
+import time
+import asyncio
+import threading
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlparse
+
+# allowed requests per second per (host, api key), everything else falls back to DEFAULT_RATE
+RATE_LIMITS = {
+    'api.opensea.io':    2,
+    'api.etherscan.io':  5,
+    'api.coingecko.com': 0.8,   # 50 calls/minute on the free plan
+}
+DEFAULT_RATE    = 5
+MIN_RATE        = 0.1
+DEFAULT_BACKOFF = 5   # seconds to pause a bucket on a 429 without Retry-After header
+MAX_BACKOFF     = 300
+
+_BUCKETS      = {}
+_BUCKETS_LOCK = threading.Lock()
+
+
+def parse_retry_after(value):
+    '''
+    Parses a Retry-After header (delay in seconds or HTTP date) into seconds to wait. Returns None if invalid.
+    '''
+    if not value:
+        return None
+    try:
+        return max(float(value), 0)
+    except ValueError:
+        pass
+    try:
+        retry_date = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if retry_date.tzinfo is None:
+        retry_date = retry_date.replace(tzinfo=timezone.utc)
+    return max((retry_date - datetime.now(timezone.utc)).total_seconds(), 0)
+
+
+class TokenBucket:
+    '''
+    Thread-safe token bucket with additive increase / multiplicative decrease of its rate. Every 429 response
+    halves the rate and pauses the bucket for the Retry-After delay, every success slowly restores the configured
+    rate, so callers settle right below the quota the server actually enforces.
+    '''
+
+    def __init__(self, rate, capacity=None):
+        self.max_rate      = float(rate)
+        self.rate          = float(rate)
+        self.capacity      = float(capacity or max(rate, 1))
+        self.tokens        = self.capacity
+        self.updated       = time.monotonic()
+        self.blocked_until = 0.0
+        self.backoff       = DEFAULT_BACKOFF
+        self.lock          = threading.Lock()
+
+    def _reserve(self):
+        '''Takes one token and returns the seconds the caller has to wait before using it'''
+        with self.lock:
+            now = time.monotonic()
+            self.tokens  = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= 1
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0
+            return max(wait, self.blocked_until - now)
+
+    def acquire(self):
+        time.sleep(self._reserve())
+
+    async def acquire_async(self):
+        await asyncio.sleep(self._reserve())
+
+    def on_response(self, status_code, retry_after=None):
+        '''Feeds the status code and Retry-After header of a response back into the bucket'''
+        with self.lock:
+            now = time.monotonic()
+            if status_code == 429:
+                delay = parse_retry_after(retry_after)
+                if delay is None:
+                    delay = self.backoff
+                    self.backoff = min(self.backoff * 2, MAX_BACKOFF)
+                self.blocked_until = max(self.blocked_until, now + delay)
+                self.rate   = max(self.rate / 2, MIN_RATE)
+                self.tokens = min(self.tokens, 0)
+            elif status_code < 400:
+                self.backoff = DEFAULT_BACKOFF
+                self.rate    = min(self.rate + self.max_rate * 0.05, self.max_rate)
+
+
+def get_bucket(url, api_key=None):
+    '''
+    Returns the process-wide bucket shared by all requests to the host of url with the same api key
+    '''
+    host = urlparse(url).netloc
+    key  = (host, api_key)
+    with _BUCKETS_LOCK:
+        if key not in _BUCKETS:
+            _BUCKETS[key] = TokenBucket(RATE_LIMITS.get(host, DEFAULT_RATE))
+        return _BUCKETS[key]
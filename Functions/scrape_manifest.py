@@ -0,0 +1,67 @@
+import os
+import json
+import time
+import shutil
+from Functions.file_handler import load_json
+
+
+class ScrapeManifest:
+    '''
+    Progress of a full collection scrape on disk. Every token id batch is written to its own file in batch_path
+    as soon as it arrives and recorded as done in the manifest, failed batches are recorded as failed. A scrape
+    that is restarted with the same manifest only requests the batches that are not done yet.
+    '''
+
+    def __init__(self, manifest_path, batch_path):
+        self.manifest_path = manifest_path
+        self.batch_path    = batch_path
+        manifest = load_json(manifest_path)
+        if 'Error' in manifest:
+            manifest = {'started_at': time.time(), 'token_ids_lists': None, 'done': [], 'failed': []}
+        self.started_at      = manifest['started_at']  # events since then are picked up by the next incremental refresh
+        self.token_ids_lists = manifest.get('token_ids_lists')  # batches of the scrape, discovered once
+        self.done            = set(manifest['done'])
+        self.failed          = set(manifest['failed'])
+        os.makedirs(batch_path, exist_ok=True)
+
+    @staticmethod
+    def get_batch_key(token_ids):
+        return f"{token_ids[0]}-{token_ids[-1]}"
+
+    def is_done(self, token_ids):
+        return self.get_batch_key(token_ids) in self.done
+
+    def save_batch(self, token_ids, assets):
+        key = self.get_batch_key(token_ids)
+        write_atomic(os.path.join(self.batch_path, f'{key}.json'), assets)
+        self.done.add(key)
+        self.failed.discard(key)
+        self.save()
+
+    def mark_failed(self, token_ids):
+        self.failed.add(self.get_batch_key(token_ids))
+        self.save()
+
+    def load_batch(self, token_ids):
+        with open(os.path.join(self.batch_path, f'{self.get_batch_key(token_ids)}.json'), 'r') as f:
+            return json.load(f)
+
+    def save(self):
+        manifest = {
+            'started_at': self.started_at, 'token_ids_lists': self.token_ids_lists,
+            'done': sorted(self.done), 'failed': sorted(self.failed),
+        }
+        write_atomic(self.manifest_path, manifest)
+
+    def remove(self):
+        '''deletes manifest and batch files once the scraped collection was saved'''
+        shutil.rmtree(self.batch_path, ignore_errors=True)
+        if os.path.exists(self.manifest_path):
+            os.remove(self.manifest_path)
+
+
+def write_atomic(str_file_path, save_obj):
+    '''writes json next to the target and moves it in place, an interrupted write never leaves a broken file'''
+    with open(str_file_path + '.tmp', 'w') as f:
+        json.dump(save_obj, f)
+    os.replace(str_file_path + '.tmp', str_file_path)
@@ -1,23 +1,99 @@
+import time
 import requests
+from requests.adapters import HTTPAdapter
+from Functions.rate_limiter import get_bucket
+from Functions.ttl_cache import ttl_cache
+from Functions.http_cache import get_http_cache, get_cache_key, get_cache_ttl, is_api_url, is_json
+from Functions.metrics import HTTP_REQUEST_SECONDS, HTTP_REQUESTS, RATE_LIMIT_WAIT_SECONDS, get_host
 
+MAX_RETRIES = 4
+POOL_SIZE   = 32
 
-def get_response(url):
-    res = requests.get(url)
-    if res.status_code != 200:
-        res = requests.get(url, headers={"User-Agent": "Mozilla/5.0"})
-        if res.status_code != 200:
-            return 'RequestsError'
-    return res
+# seconds a fetched value is shared by all monitors of the process
+COLLECTION_STATS_TTL = 30
+ETH_PRICE_TTL        = 60
 
+# one pooled session per process, shared by all monitors and scrapers so connections are kept alive
+SESSION = requests.Session()
+SESSION.mount('https://', HTTPAdapter(pool_connections=POOL_SIZE, pool_maxsize=POOL_SIZE))
+SESSION.mount('http://', HTTPAdapter(pool_connections=POOL_SIZE, pool_maxsize=POOL_SIZE))
 
+
+def get_response(url, params=None, headers=None, cache_ttl=None):
+    '''
+    Performs a rate limited HTTP GET request through the bucket shared by all callers of the host and api key.
+    Waits for Retry-After and retries on 429, retries once with a browser User-Agent on other errors.
+    Responses are served from the on-disk cache while fresh (cache_ttl seconds, default per endpoint, see
+    Functions/http_cache.py) and revalidated with ETag/Last-Modified where the server supports it.
+    Returns the response or 'RequestsError'.
+    '''
+    headers = dict(headers or {})
+    host    = get_host(url)
+    cache   = get_http_cache()
+    ttl     = get_cache_ttl(url) if cache_ttl is None else cache_ttl
+    key     = get_cache_key(url, params)
+    cached  = cache.get(key) if cache else None
+    if cached and cached.is_fresh():
+        HTTP_REQUESTS.inc(host=host, result='cached')
+        return cached.to_response()
+
+    bucket  = get_bucket(url, headers.get('X-API-KEY'))
+    for _ in range(MAX_RETRIES):
+        with RATE_LIMIT_WAIT_SECONDS.time(host=host):
+            bucket.acquire()
+        try:
+            start = time.perf_counter()
+            res = SESSION.get(url, params=params, headers={**headers, **(cached.get_validators() if cached else {})})
+        except requests.RequestException:
+            HTTP_REQUESTS.inc(host=host, result='connection_error')
+            raise
+        HTTP_REQUEST_SECONDS.observe(time.perf_counter() - start, host=host, status=res.status_code)
+        bucket.on_response(res.status_code, res.headers.get('Retry-After'))
+        if res.status_code == 304 and cached:
+            HTTP_REQUESTS.inc(host=host, result='not_modified')
+            cache.refresh(key, ttl)
+            return cached.to_response()
+        if res.status_code == 200:
+            if is_api_url(url) and not is_json(res.content):
+                # blocked, the caller sees the html page but it is never served from the cache
+                HTTP_REQUESTS.inc(host=host, result='blocked')
+                return res
+            HTTP_REQUESTS.inc(host=host, result='ok')
+            if cache and (ttl > 0 or 'ETag' in res.headers or 'Last-Modified' in res.headers):
+                cache.put(key, res.status_code, res.headers, res.content, ttl)
+            return res
+        HTTP_REQUESTS.inc(host=host, result='rate_limited' if res.status_code == 429 else 'error')
+        if res.status_code != 429:
+            if 'User-Agent' in headers:
+                break
+            headers['User-Agent'] = 'Mozilla/5.0'
+    return 'RequestsError'
+
+
+def get_data(url, cache_ttl=None):
+    res = get_response(url, cache_ttl=cache_ttl)
+    if res == 'RequestsError':
+        return 'RequestsError'
+    data = res.json()
+    return data
+
+
+@ttl_cache(COLLECTION_STATS_TTL)
+def get_os_stats(collection):
+    url = "https://api.opensea.io/api/v1/collection/" + collection
+    data = get_data(url)
+    stats = data['collection']['stats']
+
+    return stats
+
+
+@ttl_cache(ETH_PRICE_TTL)
 def get_eth_price():
-    url_eur = "https://api.coingecko.com/api/v3/simple/price?ids=ethereum&vs_currencies=eur%2Cbtc&include_market_cap=true&include_24hr_change=true"
-    url_usd = "https://api.coingecko.com/api/v3/simple/price?ids=ethereum&vs_currencies=usd%2Cbtc&include_market_cap=true&include_24hr_change=true"
-    data_eur = requests.get(url_eur).json()
-    peur = round(data_eur["ethereum"]["eur"], 2)
+    url = "https://api.coingecko.com/api/v3/simple/price?ids=ethereum&vs_currencies=eur%2Cusd%2Cbtc&include_market_cap=true&include_24hr_change=true"
+    data = get_response(url).json()
+    peur = round(data["ethereum"]["eur"], 2)
     peur = format(peur, ",")
     peur_val = float(peur.replace(',', ''))
-    data = requests.get(url_usd).json()
     pusd = round(data["ethereum"]["usd"], 2)
     pusd = format(pusd, ",")
     pusd_val = float(pusd.replace(',', ''))
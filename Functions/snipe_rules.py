@@ -0,0 +1,93 @@
+import os
+import json
+import pandas as pd
+from Functions.prices import eth_to_gwei
+
+RULES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'snipe_rules.json')
+
+
+class SnipeRule:
+    '''
+    One snipe rule of the config, all given conditions have to hold for a listing to match:
+        currency:            payment token symbol of the listing, e.g. "ETH"
+        max_price:           highest price, a number or {trait value: price} for the values of `trait`
+        rarity_rank:         [best, worst] rank band, either end can be null
+        min_rarity_score:    lowest rarity score
+        max_floor_ratio:     highest price relative to the floor of the listed token's value of `trait`
+        max_last_sale_ratio: highest price relative to the last sale price of the token
+    A rule is compiled into boolean column operations, so a batch of listings is checked in one pass. Price
+    thresholds are compared exactly in gwei if the listings have a gwei column (e.g. starting_price_gwei).
+    '''
+
+    def __init__(self, name, currency=None, trait=None, max_price=None, rarity_rank=None, min_rarity_score=None,
+                 max_floor_ratio=None, max_last_sale_ratio=None):
+        if (isinstance(max_price, dict) or max_floor_ratio is not None) and trait is None:
+            raise ValueError(f"snipe rule {name!r} needs a trait for trait thresholds or floor ratios")
+        self.name                = name
+        self.currency            = currency
+        self.trait               = trait
+        self.max_price           = max_price
+        self.rarity_rank         = rarity_rank
+        self.min_rarity_score    = min_rarity_score
+        self.max_floor_ratio     = max_floor_ratio
+        self.max_last_sale_ratio = max_last_sale_ratio
+
+    def __repr__(self):
+        return f"SnipeRule({self.name!r})"
+
+    def get_mask(self, df, floors=None, price_col="starting_price"):
+        '''
+        Returns a boolean Series that is True for the listings in df that match the rule. floors are the trait
+        floors {trait: {value: price}} used by max_floor_ratio, listings without a known floor never match it.
+        '''
+        price = df[price_col]
+        mask = pd.Series(True, index=df.index)
+        if self.currency is not None:
+            mask &= df["payment_token_symbol"] == self.currency
+        if price_col + "_gwei" in df:
+            threshold_price, to_threshold = df[price_col + "_gwei"].astype("float64"), eth_to_gwei
+        else:
+            threshold_price, to_threshold = price, float
+        if isinstance(self.max_price, dict):
+            max_price = {value: to_threshold(threshold) for value, threshold in self.max_price.items()}
+            mask &= threshold_price <= df[self.trait].astype(object).map(max_price).astype(float)
+        elif self.max_price is not None:
+            mask &= threshold_price <= to_threshold(self.max_price)
+        if self.rarity_rank is not None:
+            best, worst = self.rarity_rank
+            if best is not None:
+                mask &= df["rarity_rank"] >= best
+            if worst is not None:
+                mask &= df["rarity_rank"] <= worst
+        if self.min_rarity_score is not None:
+            mask &= df["rarity_score"] >= self.min_rarity_score
+        if self.max_floor_ratio is not None:
+            trait_floor = df[self.trait].astype(object).map((floors or {}).get(self.trait, {})).astype(float)
+            mask &= price <= trait_floor * self.max_floor_ratio
+        if self.max_last_sale_ratio is not None:
+            mask &= price <= df["last_sale_price"] * self.max_last_sale_ratio
+        return mask.fillna(False).astype(bool)
+
+
+def load_snipe_rules(name, path=RULES_PATH):
+    '''returns the rules of a rule set (usually the collection slug) of the config, empty if it has none'''
+    with open(path, 'r') as f:
+        config = json.load(f)
+    return [SnipeRule(**rule) for rule in config.get(name, [])]
+
+
+def get_snipe_matches(df, rules, floors=None, price_col="starting_price"):
+    '''
+    Evaluates the rules on a batch of listings and returns per listing the name of the first matching rule,
+    "" if no rule matches
+    '''
+    matches = pd.Series("", index=df.index, dtype=object)
+    for rule in rules:
+        mask = rule.get_mask(df, floors, price_col)
+        matches[mask & (matches == "")] = rule.name
+    return matches
+
+
+def get_snipe_mask(df, rules, floors=None, price_col="starting_price"):
+    '''True for the listings that match any of the rules'''
+    return get_snipe_matches(df, rules, floors, price_col) != ""
@@ -0,0 +1,149 @@
+import time
+import queue
+import threading
+import traceback
+import requests
+from Functions.scraping_tools import SESSION
+from Functions.metrics import TELEGRAM_SEND_SECONDS, TELEGRAM_SENDS, TELEGRAM_QUEUE_SECONDS, ALERT_LAG_SECONDS
+
+TELEGRAM_API       = 'https://api.telegram.org/bot'
+MAX_MESSAGE_LENGTH = 4096  # telegram limit for one message
+SEPARATOR          = '\n\n'
+BURST_WINDOW       = 1.0   # seconds messages of one chat are collected before they are merged and sent
+CHAT_INTERVAL      = 3.0   # seconds between two messages to the same chat (groups allow 20 per minute)
+GLOBAL_INTERVAL    = 1/30  # seconds between two messages of one bot (30 per second)
+RETRY_DELAY        = 5     # seconds to wait after a connection error
+
+
+def merge_messages(messages, max_length=MAX_MESSAGE_LENGTH):
+    '''joins as many of the queued messages as fit into one telegram message, returns text and number merged'''
+    text, count = messages[0][1], 1
+    for _, message, _ in messages[1:]:
+        if len(text) + len(SEPARATOR) + len(message) > max_length:
+            break
+        text += SEPARATOR + message
+        count += 1
+    return text, count
+
+
+def get_retry_after(response):
+    '''
+    seconds to wait after a 429: retry_after of the telegram json, the Retry-After header if the body is no json
+    (e.g. from a proxy) or RETRY_DELAY
+    '''
+    try:
+        retry_after = (response.json().get('parameters') or {}).get('retry_after')
+    except (ValueError, AttributeError):
+        retry_after = None
+    if retry_after is None:
+        try:
+            retry_after = float(response.headers.get('Retry-After'))
+        except (TypeError, ValueError):
+            retry_after = RETRY_DELAY
+    return retry_after if retry_after > 0 else RETRY_DELAY  # never 0, the worker would send again at once
+
+
+class TelegramQueue:
+    '''
+    Outbound delivery queue for telegram messages. put() returns immediately, a background thread sends the
+    messages on the pooled session. Messages for the same chat that arrive within BURST_WINDOW are merged,
+    every chat gets at most one message per CHAT_INTERVAL and a 429 flood control pauses the chat for the
+    retry_after telegram sends back.
+    '''
+
+    def __init__(self, session=SESSION):
+        self.session   = session
+        self.queue     = queue.Queue()
+        self.pending   = {}  # (bot_token, chat_id, disable_web_page_preview) -> [(enqueued_at, text, created_at), ...]
+        self.ready_at  = {}  # (bot_token, chat_id) -> time the chat may receive the next message
+        self.last_sent = 0.0
+        self.queued    = 0   # messages put but not yet sent or dropped
+        self.thread    = None
+        self.lock      = threading.Lock()
+
+    def put(self, bot_message, bot_token, bot_chatID, disable_web_page_preview=False, created_at=None):
+        '''created_at is the unix time of the event the message is about, its delay until sent is measured'''
+        with self.lock:
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._run, name='telegram-queue', daemon=True)
+                self.thread.start()
+            self.queued += 1
+        self.queue.put((time.monotonic(), (bot_token, bot_chatID, disable_web_page_preview), bot_message, created_at))
+
+    def flush(self, timeout=30):
+        '''blocks until all queued messages are delivered or the timeout is over'''
+        deadline = time.monotonic() + timeout
+        while self.queued and time.monotonic() < deadline:
+            time.sleep(0.1)
+
+    def _run(self):
+        while True:
+            try:
+                enqueued_at, key, text, created_at = self.queue.get(timeout=self._next_wait())
+                self.pending.setdefault(key, []).append((enqueued_at, text, created_at))
+            except queue.Empty:
+                pass
+            try:
+                self._send_due()
+            except Exception:
+                traceback.print_exc()
+
+    def _next_wait(self):
+        '''seconds until the next chat is due, None if nothing is pending'''
+        if not self.pending:
+            return None
+        due = min(
+            max(messages[0][0] + BURST_WINDOW, self.ready_at.get(key[:2], 0))
+            for key, messages in self.pending.items()
+        )
+        return max(due - time.monotonic(), 0)
+
+    def _send_due(self):
+        for key in list(self.pending):
+            messages = self.pending[key]
+            now = time.monotonic()
+            if messages[0][0] + BURST_WINDOW > now or self.ready_at.get(key[:2], 0) > now:
+                continue
+            text, count = merge_messages(messages)
+            retry_after = self._send(key, text)
+            if retry_after:
+                self.ready_at[key[:2]] = time.monotonic() + retry_after
+                continue
+            self.ready_at[key[:2]] = time.monotonic() + CHAT_INTERVAL
+            for enqueued_at, _, created_at in messages[:count]:
+                TELEGRAM_QUEUE_SECONDS.observe(time.monotonic() - enqueued_at)
+                if created_at is not None:
+                    ALERT_LAG_SECONDS.observe(time.time() - created_at, chat=key[1])
+            del messages[:count]
+            with self.lock:
+                self.queued -= count
+            if not messages:
+                del self.pending[key]
+
+    def _send(self, key, text):
+        '''sends one message, returns the seconds to wait before a retry or None if it must not be retried'''
+        bot_token, bot_chatID, disable_web_page_preview = key
+        time.sleep(max(self.last_sent + GLOBAL_INTERVAL - time.monotonic(), 0))
+        self.last_sent = time.monotonic()
+        params = {'chat_id': bot_chatID, 'parse_mode': 'Markdown', 'text': text}
+        if disable_web_page_preview:
+            params['disable_web_page_preview'] = 'true'
+        start = time.perf_counter()
+        try:
+            response = self.session.post(TELEGRAM_API + bot_token + '/sendMessage', data=params, timeout=30)
+        except requests.RequestException as e:
+            TELEGRAM_SENDS.inc(result='retried')
+            print(f"Telegram Error {e!r}, retry in {RETRY_DELAY}s")
+            return RETRY_DELAY
+        TELEGRAM_SEND_SECONDS.observe(time.perf_counter() - start, status=response.status_code)
+        if response.status_code == 429:
+            TELEGRAM_SENDS.inc(result='retried')
+            retry_after = get_retry_after(response)
+            print(f"Telegram flood control for chat {bot_chatID}, retry in {retry_after}s")
+            return retry_after
+        if response.status_code != 200:
+            TELEGRAM_SENDS.inc(result='failed')
+            print(f"Telegram Error {response.status_code}: {response.text}")
+        else:
+            TELEGRAM_SENDS.inc(result='sent')
+        return None
@@ -1,6 +1,8 @@
 import os
-import requests
+import atexit
 from dotenv import load_dotenv
+from Functions.scraping_tools import SESSION
+from Functions.telegram_queue import TelegramQueue
 
 # Load environment variables
 load_dotenv()
@@ -11,6 +13,10 @@ bot_chatID_group       = str(os.getenv('TELEGRAM_BOT_CHATID_GROUP'))    # Replac
 bot_chatID_private     = str(os.getenv('TELEGRAM_BOT_CHATID_PRIVATE'))  # Replace with your own bot_chatID
 etherscan_api_key      = str(os.getenv('ETHERSCAN_API_KEY'))            # Replace with your own apy key
 
+# shared delivery queue, messages still queued when the process exits are flushed
+delivery_queue = TelegramQueue()
+atexit.register(delivery_queue.flush)
+
 
 def telegram_bot_sendtext(bot_message, bot_token=bot_token, bot_chatID=bot_chatID_group, disable_web_page_preview=False):
     """
@@ -20,16 +26,30 @@ def telegram_bot_sendtext(bot_message, bot_token=bot_token, bot_chatID=bot_chatI
     default from environment variable
     :return: response status, eg. <Response [200]>
     """
-    send_text  = 'https://api.telegram.org/bot' + bot_token
-    send_text += '/sendMessage?chat_id=' + bot_chatID
+    send_text = 'https://api.telegram.org/bot' + bot_token + '/sendMessage'
+    params    = {'chat_id': bot_chatID, 'parse_mode': 'Markdown', 'text': bot_message}
     if disable_web_page_preview:
-        send_text += '&disable_web_page_preview=true'
-    send_text += '&parse_mode=Markdown&text=' + bot_message
-    response = requests.get(send_text)
+        params['disable_web_page_preview'] = 'true'
+    response = SESSION.get(send_text, params=params)
     print(response)
     return response.json()
 
 
+def telegram_bot_queue_text(bot_message, bot_token=bot_token, bot_chatID=bot_chatID_group, disable_web_page_preview=False,
+                            created_at=None):
+    """
+    Same as telegram_bot_sendtext, but returns immediately: the message is delivered in the background by the
+    shared delivery queue, merged with other messages to the same chat and sent respecting telegram's flood limits.
+    :param bot_message: str, Message to be sent
+    :param bot_token: str, Token of your bot defined @botFather, default: from environment variable
+    :param bot_chatID: str, ID of the chat you want to send the message to (could be an individual chat or channel),
+    default from environment variable
+    :param created_at: float, unix time of the event the message is about, the delay until sent is measured as alert lag
+    :return: None
+    """
+    delivery_queue.put(bot_message, bot_token, bot_chatID, disable_web_page_preview, created_at)
+
+
 def telegram_bot_sendphoto_file(str_picpath, bot_token=bot_token, bot_chatID=bot_chatID_group):
     """
     :param str_picpath: str, path to the image
@@ -38,9 +58,9 @@ def telegram_bot_sendphoto_file(str_picpath, bot_token=bot_token, bot_chatID=bot
     default: from environment variable
     :return:
     """
-    send_photo = 'https://api.telegram.org/bot' + bot_token + '/sendPhoto?chat_id=' + bot_chatID
-    files = {'photo': open(str_picpath, 'rb')}
-    img_stat = requests.post(send_photo, files=files)
+    send_photo = 'https://api.telegram.org/bot' + bot_token + '/sendPhoto'
+    with open(str_picpath, 'rb') as photo:
+        img_stat = SESSION.post(send_photo, params={'chat_id': bot_chatID}, files={'photo': photo})
     return img_stat
 
 
@@ -52,8 +72,8 @@ def telegram_bot_sendphoto_url(url_pic, bot_token=bot_token, bot_chatID=bot_chat
     default: from environment variable
     :return:
     """
-    send_photo = 'https://api.telegram.org/bot' + bot_token + '/sendPhoto?chat_id=' + bot_chatID + '&photo=' + url_pic
-    img_stat = requests.get(send_photo)
+    send_photo = 'https://api.telegram.org/bot' + bot_token + '/sendPhoto'
+    img_stat = SESSION.get(send_photo, params={'chat_id': bot_chatID, 'photo': url_pic})
     return img_stat
 
 
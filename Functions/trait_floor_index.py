@@ -0,0 +1,107 @@
+import heapq
+import pandas as pd
+from Functions.prices import wei_to_eth
+
+REMOVING_EVENTS = ('cancelled', 'successful', 'transfer')  # events that end the active listing of a token
+
+
+class TraitFloorIndex:
+    '''
+    Live floor price per trait value. Every (trait, value) has a min-heap of (price, token_id) of the active ETH
+    listings, listings that were replaced, cancelled or sold are dropped lazily when they reach the top of the
+    heap, so a floor query only looks at the top. Events older than the last applied event of a token are
+    ignored, so the same events can be fed repeatedly and in any order.
+    '''
+
+    def __init__(self, token_traits):
+        self.token_traits = token_traits  # token_id -> [(trait, value), ...]
+        self.listings     = {}            # token_id -> price of its active listing
+        self.updated_at   = {}            # token_id -> time of the last applied event
+        self.heaps        = {}            # (trait, value) -> [(price, token_id), ...]
+        self.trait_values = {}            # trait -> {value, ...}
+        for token_trait_values in token_traits.values():
+            for trait, value in token_trait_values:
+                self.trait_values.setdefault(trait, set()).add(value)
+
+    @classmethod
+    def from_collection(cls, df):
+        '''
+        Builds the index from a processed collection, the cheapest stored ETH sell order of every token is its
+        initial listing (a token can have several rows)
+        '''
+        df = df.copy()
+        df["token_id"] = df["token_id"].astype(int)
+        traits = [col for col in df.columns if col.startswith("Trait_")]
+        df_traits = df.melt(id_vars="token_id", value_vars=traits, var_name="trait").dropna(subset=["value"]).drop_duplicates()
+        token_traits = {}
+        for token_id, trait, value in zip(df_traits["token_id"], df_traits["trait"], df_traits["value"]):
+            token_traits.setdefault(token_id, []).append((trait, value))
+        index = cls(token_traits)
+
+        df_listed = df[df["payment_token_sell_order"]=="ETH"].sort_values("current_price", kind="stable")
+        df_listed = df_listed.drop_duplicates("token_id")
+        listed_at = df_listed["created_date_sell_order"] if "created_date_sell_order" in df_listed else [None]*len(df_listed)
+        for token_id, price, created_date in zip(df_listed["token_id"], df_listed["current_price"], listed_at):
+            index.add_listing(token_id, price, to_timestamp(created_date))
+        return index
+
+    def _is_newer(self, token_id, timestamp):
+        if timestamp is None:
+            return True
+        if timestamp < self.updated_at.get(token_id, float('-inf')):
+            return False
+        self.updated_at[token_id] = timestamp
+        return True
+
+    def add_listing(self, token_id, price, timestamp=None):
+        if token_id not in self.token_traits or not self._is_newer(token_id, timestamp):
+            return
+        if self.listings.get(token_id) == price:
+            return
+        self.listings[token_id] = price
+        for key in self.token_traits[token_id]:
+            heapq.heappush(self.heaps.setdefault(key, []), (price, token_id))
+
+    def remove_listing(self, token_id, timestamp=None):
+        if self._is_newer(token_id, timestamp):
+            self.listings.pop(token_id, None)
+
+    def apply_event(self, event):
+        '''feeds one event of the opensea events endpoint into the index'''
+        if not event.get('asset'):
+            return
+        token_id  = int(event['asset']['token_id'])
+        timestamp = to_timestamp(event.get('created_date'))
+        if event['event_type'] == 'created':
+            if (event.get('payment_token') or {}).get('symbol') == 'ETH' and event.get('auction_type') != 'english':
+                self.add_listing(token_id, wei_to_eth(event['starting_price']), timestamp)
+        elif event['event_type'] in REMOVING_EVENTS:
+            self.remove_listing(token_id, timestamp)
+
+    def get_floor(self, trait, value):
+        '''returns (price, token_id) of the cheapest active listing with this trait value or None'''
+        heap = self.heaps.get((trait, value))
+        while heap:
+            price, token_id = heap[0]
+            if self.listings.get(token_id) == price:
+                return price, token_id
+            heapq.heappop(heap)
+        return None
+
+    def get_floors(self, trait):
+        '''returns {value: floor price} of all values of a trait that have an active listing'''
+        floors = {}
+        for value in self.trait_values.get(trait, ()):
+            floor = self.get_floor(trait, value)
+            if floor:
+                floors[value] = floor[0]
+        return floors
+
+    def get_traits(self):
+        return sorted(self.trait_values)
+
+
+def to_timestamp(date):
+    if date is None or (not isinstance(date, str) and pd.isna(date)):
+        return None
+    return pd.Timestamp(date).timestamp()
@@ -0,0 +1,61 @@
+import time
+import threading
+from functools import wraps
+
+
+class TTLCache:
+    '''
+    Thread-safe cache whose entries expire ttl seconds after they were fetched. Concurrent calls for a key that
+    is currently being fetched wait for that one fetch instead of starting their own (request coalescing).
+    Failed fetches are not cached, the waiting callers then retry the fetch themselves.
+    '''
+
+    def __init__(self, ttl):
+        self.ttl       = ttl
+        self.entries   = {}  # key -> (expires_at, value)
+        self.in_flight = {}  # key -> threading.Event of the running fetch
+        self.lock      = threading.Lock()
+
+    def get(self, key, fetch):
+        while True:
+            with self.lock:
+                entry = self.entries.get(key)
+                if entry and entry[0] > time.monotonic():
+                    return entry[1]
+                event = self.in_flight.get(key)
+                is_owner = event is None
+                if is_owner:
+                    event = self.in_flight[key] = threading.Event()
+            if not is_owner:
+                event.wait()
+                continue
+            try:
+                value = fetch()
+                with self.lock:
+                    self.entries[key] = (time.monotonic() + self.ttl, value)
+                return value
+            finally:
+                with self.lock:
+                    del self.in_flight[key]
+                event.set()
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+def ttl_cache(ttl):
+    '''
+    Decorator that shares the result of a function per arguments for ttl seconds across all threads of the
+    process. The freshness window can be changed later through func.cache.ttl.
+    '''
+    def decorator(func):
+        cache = TTLCache(ttl)
+
+        @wraps(func)
+        def wrapper(*args):
+            return cache.get(args, lambda: func(*args))
+
+        wrapper.cache = cache
+        return wrapper
+    return decorator
@@ -1,108 +1,130 @@
 import pandas as pd
 import numpy as np
+from array import array
+from itertools import chain
 import argparse
-import json
 from time import time
+from Functions.file_handler import iter_json_array
+from Functions.collection_store import CollectionWriter
+from Functions.prices import to_gwei_array, gwei_array_to_eth, GWEI_DTYPE
 
 COLLECTION = "clonex"
 INPUT_PATH = f'data/{COLLECTION}.json'
-OUTPUT_PATH = f'data/{COLLECTION}_processed.csv'
-COLLECTION_SIZE = 0
-TRAITS = []
-TRAIT_LABELS = []
-TRAIT_LABEL_DICT = {}
-TRAIT_COUNT_STAT = {}
-
-ETH_NORMALIZATION_CONSTANT = 1000000000000000000
-
-
-def get_all_trait_types(trait_list):
-    '''iterates through trait column and returns unque set of trait types (e.g. type, dna, etcs)'''
-    trait_types = set()
-    for row in trait_list:
-        for trait_dic in row:
-            trait_type = trait_dic["trait_type"]
-            trait_types.add(trait_type)
-    
-    return trait_types
+DATA_PATH = 'data'
+
+CHUNK_SIZE = 5000
+
+# fields of the api response that are kept by the streaming ingest
+ASSET_FIELDS = ["token_id", "name", "permalink", "image_thumbnail_url", "traits", "sell_orders", "last_sale"]
+SELL_ORDER_FIELDS = ["created_date", "closing_date", "current_price", "payment_token_contract", "quantity"]
+LAST_SALE_FIELDS = ["event_timestamp", "created_date", "payment_token", "total_price", "quantity"]
+
+# parsed columns, also used for batches without any sell order or last sale
+SELL_ORDER_DTYPES = {
+    "created_date": "datetime64[ns]", "closing_date": "datetime64[ns]", "current_price": "float64",
+    "payment_token_contract": "object", "quantity": "object", "payment_token": "object", "current_price_gwei": GWEI_DTYPE,
+}
+LAST_SALE_DTYPES = {
+    "event_timestamp": "datetime64[ns]", "created_date": "datetime64[ns]", "payment_token": "object",
+    "total_price": "float64", "quantity": "float64", "last_sale_price": "float64", "last_sale_price_gwei": GWEI_DTYPE,
+}
+
+
+def get_trait_table(traits):
+    '''
+    Flattens the traits column into one long table with one row per asset and trait. The index of the table is
+    the index of the asset, position is the order of the trait within the asset.
+    '''
+    traits = traits.map(lambda x: x if isinstance(x, list) else [])
+    lengths = traits.map(len).to_numpy()
+    df_long = pd.DataFrame.from_records(
+        list(chain.from_iterable(traits)), columns=["trait_type", "value", "trait_count"]
+    )
+    df_long.index = np.repeat(traits.index.to_numpy(), lengths)
+    df_long["position"] = get_trait_positions(lengths)
+    return df_long
+
+
+def get_trait_positions(lengths):
+    '''returns the position of every trait within its asset for assets with the given number of traits'''
+    return np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+
+
+def get_trait_label(trait_type):
+    return "Trait_" + trait_type.replace(" ","_")
+
+
+def get_rarity_scores(df_long, index, collection_size):
+    '''
+    Sums the rarity 1 / (trait_count / collection_size) of all traits per asset. The traits of all assets are
+    added position by position, which gives the same floating point result as adding them up per asset.
+    '''
+    trait_count = df_long["trait_count"].to_numpy(dtype=float)
+    with np.errstate(divide="ignore"):
+        trait_rarity = np.where(trait_count == 0, 0, 1 / (trait_count / collection_size)) # 0 is weird behavior from OPensea API Response
+
+    rows = index.get_indexer(df_long.index)
+    rarity_matrix = np.zeros((len(index), int(df_long["position"].max()) + 1 if len(df_long) else 0))
+    rarity_matrix[rows, df_long["position"].to_numpy()] = trait_rarity
+
+    rarity_score = np.zeros(len(index))
+    for column in rarity_matrix.T:
+        rarity_score += column
+    return pd.Series(rarity_score, index=index, name="rarity_score")
 
-def get_trait_column(trait_list):
-    ''' Returns a vector / pd.Series of all trait types with corresponding values''' 
-    trait_col = {trait: np.nan for trait in TRAIT_LABELS}
-    
-    rarity_score = 0
-    
-    for trait_dic in trait_list:
-        trait_type = trait_dic["trait_type"]
-        trait_value = trait_dic["value"]
-        trait_count = trait_dic["trait_count"]
-        
-        # compute rarity score
-        if trait_count == 0: # weird behavior from OPensea API Response
-            trait_rarity = 0
-        else:
-            trait_rarity = 1 / (trait_count/COLLECTION_SIZE)
-
-        rarity_score += trait_rarity
-        
-        if trait_type not in TRAIT_COUNT_STAT.keys():
-            TRAIT_COUNT_STAT[trait_type] = {}
-        
-        TRAIT_COUNT_STAT[trait_type][trait_value] = trait_count
-        
-
-        trait_label = TRAIT_LABEL_DICT[trait_type]
-        trait_col[trait_label] = trait_value
-    
-    trait_col["rarity_score"] = rarity_score
-    
-    return pd.Series(trait_col)
 
 def make_clickable(val):
     return '<a href="{}">{}</a>'.format(val,val)
 
 
-def process_trait_data(df):
+def process_trait_data(df, collection_size=None, trait_labels=None, rarity_rank=None):
     '''
     Takes traits column from df and adds a separate trait column per trait with the respective value
-    and calculates overall rarity score per item. Potential issues if 1 to n mappings of attributes 
-    (e.g. 1 asset kan have multiple values of trait value type)
+    and calculates overall rarity score per item. If 1 asset has multiple values of the same trait type
+    the last one is kept. collection_size defaults to the number of rows in df, trait_labels to the traits
+    found in df and rarity_rank (pd.Series by index of df) to the rank within df.
     '''
-    global COLLECTION_SIZE
-    COLLECTION_SIZE = df.shape[0]
-
-    # add 1 empty column per trait
-    TRAITS = list(get_all_trait_types(df["traits"]))
-    for trait in TRAITS:
-        trait_ = trait.replace(" ","_")
-        trait_label = "Trait_" + trait_
-        #df[trait_label] = np.nan
-        TRAIT_LABELS.append(trait_label)
-        
-    # mapping diczionary from open sea to column label of the df
-    global TRAIT_LABEL_DICT
-    TRAIT_LABEL_DICT = dict(zip(TRAITS, TRAIT_LABELS))
-
-    df_traits = df.apply(lambda x: get_trait_column(x["traits"]), axis=1)
+    if collection_size is None:
+        collection_size = df.shape[0]
+
+    df_long = get_trait_table(df["traits"])
+    df_long["trait_label"] = df_long["trait_type"].map(get_trait_label)
+
+    # 1 column per trait with the respective value, in order of first appearance
+    if trait_labels is None:
+        trait_labels = list(df_long["trait_label"].unique())
+    keys = pd.MultiIndex.from_arrays([df_long.index, df_long["trait_label"]])
+    df_values = pd.Series(df_long["value"].to_numpy(), index=keys)[~keys.duplicated(keep="last")]
+    df_traits = df_values.unstack().reindex(index=df.index, columns=trait_labels)
+    df_traits["rarity_score"] = get_rarity_scores(df_long, df.index, collection_size)
+
     df = pd.concat([df, df_traits], axis=1)
-    df["rarity_rank"] = df["rarity_score"].rank(method="dense", ascending=False).astype(int)
+    if rarity_rank is None:
+        df["rarity_rank"] = df["rarity_score"].rank(method="dense", ascending=False).astype(int)
+    else:
+        df["rarity_rank"] = rarity_rank.reindex(df.index)
     
-    df["permalink"]=df.apply(lambda x: make_clickable(x["permalink"]), axis=1)
+    df["permalink"]=df["permalink"].map(make_clickable)
     return df
 
 
 def process_sell_orders(df):
     '''
     Turns sell orders that come as a dictionary from the opensea api into separate columns and 
-    parses data types
+    parses data types. Prices are kept exact as integer gwei (current_price_gwei), current_price is the
+    same price as float ETH.
     '''
     # filter for the ones that are for sale and add to df
-    df_for_sale = df[df["sell_orders"].notna()]
-    df_sell_orders = df_for_sale["sell_orders"].explode().apply(pd.Series)
-    df_sell_orders["current_price"] = df_sell_orders["current_price"].astype(float)/ETH_NORMALIZATION_CONSTANT
-    df_sell_orders["payment_token"] = df_sell_orders["payment_token_contract"].apply(lambda x: x['symbol'])
-    df_sell_orders["created_date"] = df_sell_orders["created_date"].astype('datetime64[ns]')
-    df_sell_orders["closing_date"] = df_sell_orders["closing_date"].astype('datetime64[ns]')
+    orders = df.loc[df["sell_orders"].notna(), "sell_orders"].explode().dropna()
+    if orders.empty: # keep the parsed columns so that later merges get the same suffixes
+        df_sell_orders = pd.DataFrame({col: pd.Series(dtype=dtype) for col, dtype in SELL_ORDER_DTYPES.items()})
+    else:
+        df_sell_orders = pd.DataFrame.from_records(orders.tolist(), index=orders.index)
+        df_sell_orders["current_price_gwei"] = to_gwei_array(df_sell_orders["current_price"])
+        df_sell_orders["current_price"] = gwei_array_to_eth(df_sell_orders["current_price_gwei"])
+        df_sell_orders["payment_token"] = [(token or {}).get('symbol') for token in df_sell_orders["payment_token_contract"]]
+        df_sell_orders["created_date"] = df_sell_orders["created_date"].astype('datetime64[ns]')
+        df_sell_orders["closing_date"] = df_sell_orders["closing_date"].astype('datetime64[ns]')
     df = pd.merge(df, df_sell_orders, how="left", left_index=True, right_index=True)
 
     return df
@@ -110,54 +132,118 @@ def process_sell_orders(df):
 def process_last_sales(df):
     '''
     Turns last sales of an assets that come as a dictionary from the opensea api into separate columns and 
-    parses data types
+    parses data types. last_sale_price is the price per item, exact in last_sale_price_gwei.
     '''
     # filter for the ones with a last sale and add to whole df
     df_last_sale = df[df["last_sale"].notna()]
-    df_sales = df_last_sale["last_sale"].apply(pd.Series)
-    df_sales["event_timestamp"] = df_sales["event_timestamp"].astype('datetime64[ns]')
-    df_sales["created_date"] = df_sales["created_date"].astype('datetime64[ns]')
-    df_sales["payment_token"] = df_sales["payment_token"].apply(lambda x: x['symbol'])
-    df_sales["total_price"] = df_sales["total_price"].astype(float)
-    df_sales["quantity"] = df_sales["quantity"].astype(float)
-    df_sales["last_sale_price"] = df_sales["total_price"]/(df_sales["quantity"] * ETH_NORMALIZATION_CONSTANT)
+    if df_last_sale.empty: # keep the parsed columns so that later merges get the same suffixes
+        df_sales = pd.DataFrame({col: pd.Series(dtype=dtype) for col, dtype in LAST_SALE_DTYPES.items()})
+    else:
+        df_sales = pd.DataFrame.from_records(df_last_sale["last_sale"].tolist(), index=df_last_sale.index)
+        df_sales["event_timestamp"] = df_sales["event_timestamp"].astype('datetime64[ns]')
+        df_sales["created_date"] = df_sales["created_date"].astype('datetime64[ns]')
+        df_sales["payment_token"] = [(token or {}).get('symbol') for token in df_sales["payment_token"]]
+        df_sales["last_sale_price_gwei"] = to_gwei_array(df_sales["total_price"], df_sales["quantity"])
+        df_sales["last_sale_price"] = gwei_array_to_eth(df_sales["last_sale_price_gwei"])
+        df_sales["total_price"] = df_sales["total_price"].astype(float)
+        df_sales["quantity"] = df_sales["quantity"].astype(float)
     df = pd.merge(df, df_sales, how="left", left_index=True, right_index=True, suffixes=('_sell_order', '_last_sale'))
 
     return df
 
-def run_data_preprocessing(df):
+def run_data_preprocessing(df, collection_size=None, trait_labels=None, rarity_rank=None):
 
-    df = process_trait_data(df)
+    df = process_trait_data(df, collection_size, trait_labels, rarity_rank)
     df = process_sell_orders(df)
     df = process_last_sales(df)
 
     return df
 
 
+def slim_asset(asset):
+    '''keeps only the fields of an api asset that are needed for preprocessing and the dashboard'''
+    slim = {field: asset.get(field) for field in ASSET_FIELDS}
+    if slim["sell_orders"]:
+        slim["sell_orders"] = [{field: order.get(field) for field in SELL_ORDER_FIELDS} for order in slim["sell_orders"]]
+        for order in slim["sell_orders"]:
+            order["payment_token_contract"] = {"symbol": (order["payment_token_contract"] or {}).get("symbol")}
+    if slim["last_sale"]:
+        slim["last_sale"] = {field: slim["last_sale"].get(field) for field in LAST_SALE_FIELDS}
+        slim["last_sale"]["payment_token"] = {"symbol": (slim["last_sale"]["payment_token"] or {}).get("symbol")}
+    return slim
+
+
+def iter_asset_chunks(input_path, chunk_size=CHUNK_SIZE):
+    '''streams the assets of a scraped json file in lists of at most chunk_size slim assets'''
+    chunk = []
+    for asset in iter_json_array(input_path):
+        chunk.append(slim_asset(asset))
+        if len(chunk) == chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def get_collection_summary(input_path):
+    '''
+    First streaming pass over a scraped collection. Returns the collection size, all trait labels in order of
+    first appearance and the rarity rank of every asset by its position in the file.
+    '''
+    trait_labels = {}
+    trait_counts, lengths = array('d'), array('l')
+    for asset in iter_json_array(input_path):
+        traits = asset.get("traits") or []
+        lengths.append(len(traits))
+        for trait in traits:
+            trait_labels[get_trait_label(trait["trait_type"])] = None
+            trait_counts.append(trait["trait_count"])
+
+    collection_size = len(lengths)
+    lengths = np.asarray(lengths, dtype=int)
+    df_long = pd.DataFrame(
+        {"trait_count": np.asarray(trait_counts), "position": get_trait_positions(lengths)},
+        index=np.repeat(np.arange(collection_size), lengths),
+    )
+    rarity_score = get_rarity_scores(df_long, pd.RangeIndex(collection_size), collection_size)
+    rarity_rank = rarity_score.rank(method="dense", ascending=False).astype(int)
+    return collection_size, list(trait_labels), rarity_rank
+
+
+def run_streaming_preprocessing(input_path, collection, data_path=DATA_PATH, chunk_size=CHUNK_SIZE):
+    '''
+    Preprocesses a scraped json file without materializing it. A first pass collects the collection wide
+    values (size, trait labels, rarity ranks), the second pass preprocesses chunk_size assets at a time and
+    writes each chunk into the processed store, so memory stays bounded by the chunk size.
+    '''
+    collection_size, trait_labels, rarity_rank = get_collection_summary(input_path)
+    writer = CollectionWriter(collection, data_path)
+    offset = 0
+    for chunk in iter_asset_chunks(input_path, chunk_size):
+        df = pd.DataFrame(chunk, index=pd.RangeIndex(offset, offset + len(chunk)))
+        df = run_data_preprocessing(df, collection_size, trait_labels, rarity_rank)
+        writer.write(df)
+        offset += len(chunk)
+    return writer.close()
+
+
 if __name__ == '__main__':
 
     parser = argparse.ArgumentParser()
     parser.add_argument('--collection', type=str, help='slug name of collection', default="")
+    parser.add_argument('--chunksize', type=int, help='Number of assets preprocessed at once', default=CHUNK_SIZE)
     args = parser.parse_args()
     collection = args.collection
 
     if collection:
         COLLECTION = collection
         INPUT_PATH = f'data/{COLLECTION}.json'
-        OUTPUT_PATH = f'data/{COLLECTION}_processed.csv'
-
-    # read scraped data from json file and convert to data frame
-    with open(INPUT_PATH, 'r') as fp:
-        asset_list = json.load(fp)
 
+    # stream scraped data from json file into the processed store
     print(f"START Data Preprocessing for: {COLLECTION}")
     start_timer = time()
-    df = pd.DataFrame(asset_list)
-    df = run_data_preprocessing(df)
-    
+    output_path = run_streaming_preprocessing(INPUT_PATH, COLLECTION, DATA_PATH, args.chunksize)
+
     end_timer = time()
     run_time = end_timer-start_timer
-
-    # save data as csv
-    df.to_csv(OUTPUT_PATH, index=False)
-    print(f"Data Preprocessing run in {round(run_time, 2)}s and saved in: {OUTPUT_PATH}")
+    print(f"Data Preprocessing run in {round(run_time, 2)}s and saved in: {output_path}")
@@ -1,38 +1,62 @@
-import requests
 import json
-import numpy as np
+import asyncio
 import pandas as pd
 from time import time
 import argparse
-from joblib import Parallel, delayed
-from Opensea_Scrape.preprocess import run_data_preprocessing
+from Functions.crawler import crawl, fetch_json
+from Functions.scraping_tools import get_response
+from Functions.listing_events import decode_listing_events
+from Functions.file_handler import save_json, load_json, save_json_array, iter_json_array
+from Functions.collection_store import save_collection, load_collection, collection_exists, DATA_PATH
+from Functions.scrape_manifest import ScrapeManifest
+from Functions.metrics import HTTP_REQUESTS, get_host
+from Opensea_Scrape.preprocess import run_data_preprocessing, run_streaming_preprocessing, slim_asset
 import os 
 
 global COLLECTION
 COLLECTION = "clonex" # "cryptopunks", "boredapeyachtclub"
 OUTPUT_PATH = f'../Data/{COLLECTION}.json'
+CHECKPOINT_PATH = f'../Data/{COLLECTION}_checkpoint.json'
+MANIFEST_PATH = f'../Data/{COLLECTION}_manifest.json'
+BATCH_PATH = f'../Data/{COLLECTION}_batches'
+MINTS_PATH = f'../Data/{COLLECTION}_mints.json' # token ids discovered from the mint events and when
+MINTS_OVERLAP = 120 # seconds requested before the mint checkpoint, so events indexed late are not missed
+MAX_ROUNDS = 3 # rounds of retrying failed batches before a scrape gives up until the next run
+NULL_ADDRESS = "0x0000000000000000000000000000000000000000" # sender of mints, receiver of burns
+API_URL = "https://api.opensea.io/api/v1" # the benchmarks point it to a local mock server
 OPENSEA_APIKEY = str(os.getenv('OPENSEA_APIKEY'))    
 
-def get_events(collection_slug, limit=300, offset=0, json_file="", event_type=''):
+def get_events(collection_slug, limit=300, offset=0, json_file="", event_type='', occurred_after=None, cursor=None,
+               account_address=None):
     '''
     Perform HTTP Get Request to get current events on open sea for a given collection
     '''
-    url = "https://api.opensea.io/api/v1/events"
+    url = f"{API_URL}/events"
     querystring = {
         "collection_slug":collection_slug,
         "only_opensea":"false", 
-        "offset":"{}".format(offset), 
         "limit":"{}".format(limit), 
                   }
     
+    if cursor:
+        querystring['cursor'] = cursor
+    else:
+        querystring['offset'] = "{}".format(offset)
     if event_type != '':
         querystring['event_type'] = event_type
+    if occurred_after:
+        querystring['occurred_after'] = "{}".format(int(occurred_after))
+    if account_address:
+        querystring['account_address'] = account_address
 
     apikey = OPENSEA_APIKEY
     headers = None if apikey == "" else {"X-API-KEY": apikey}
-    response = requests.request("GET", url, headers=headers, params=querystring)
-        
+    response = get_response(url, params=querystring, headers=headers)
+
+    if response == 'RequestsError':
+        return None
     if "<!doctype html>" in response.text[:20].lower():
+        HTTP_REQUESTS.inc(host=get_host(url), result='blocked')
         return None # blocked request
     return response.json()
     
@@ -40,32 +64,16 @@ def get_new_listings(collection, limit=30):
     '''
     Get the newest listings for a collection as a pd.Dataframe for a collection
     '''
-    ETH_NORM_CONSTANT = 1000000000000000000
     # get data via opensea api
     opensea_response = get_events(collection, limit=limit, event_type="created")
-    #cleaned_response = clean_response(opensea_response)
-    # turn json in dataframe
-    df_new_list = pd.DataFrame(opensea_response["asset_events"])
-    # some parsing and cleaning
-    df_new_list["token_id"] = df_new_list['asset'].apply(pd.Series)["token_id"].astype(int)
-    df_new_list["payment_token_symbol"] = df_new_list["payment_token"].apply(lambda x: x["symbol"])
-    cols = [ "token_id","event_type", "created_date", "starting_price", "ending_price", "payment_token_symbol"]
-    df_rec_listings = df_new_list[cols]
-    df_rec_listings["starting_price"] = df_rec_listings["starting_price"].astype(float)/ETH_NORM_CONSTANT
-    df_rec_listings["ending_price"] = df_rec_listings["ending_price"].astype(float)/ETH_NORM_CONSTANT
-    df_rec_listings["token_id"] = df_rec_listings["token_id"].astype(int)
-    
-    df_rec_listings['created_date'] = pd.to_datetime(df_rec_listings['created_date'], format='%Y-%m-%d %H:%M')
-#    df_rec_listings['listing_date'] = pd.to_datetime(df_rec_listings['listing_date'])
-    
-    return df_rec_listings
+    return decode_listing_events(opensea_response["asset_events"])
 
 def get_assets(owner:str=None, token_ids:list=None, limit:int=50, order_by:str = None,
                order_direction:str="asc", offset:int=0, collection:str=None):
     '''
     Performs HTTP GET request to open sea APi to retrieve assets. Returns HTTP response as dict.
     '''
-    url = "https://api.opensea.io/api/v1/assets"
+    url = f"{API_URL}/assets"
     
     # parsing of query parameters
     querystring = dict()
@@ -82,20 +90,17 @@ def get_assets(owner:str=None, token_ids:list=None, limit:int=50, order_by:str =
     querystring["order_direction"]=order_direction
     querystring["offset"]=offset
     
-    # perfrom HTTP get request to opensea API
-    response = requests.request("GET", url, params=querystring)
+    # perfrom rate limited HTTP get request to opensea API
+    response = get_response(url, params=querystring)
 
-    status_code = response.status_code
-    
-    if status_code==200:
+    if response != 'RequestsError':
         response_dict = json.loads(response.text)
         no_assets = len(response_dict["assets"])
         #print(f"{no_assets} assets succesfully retrieved")
         return response_dict
         
     else:
-        print(f"Error {status_code} occured")
-        print(response.text)
+        print(f"Error occured for {url}")
         return {}
 
 
@@ -103,77 +108,286 @@ def get_stats(collection:str=None):
     '''
     Performs HTTP GET request to open sea APi to get statistics for a collection. Returns HTTP response as dict.
     '''
-    url = f"https://api.opensea.io/api/v1/collection/{collection}/stats"
+    url = f"{API_URL}/collection/{collection}/stats"
     headers = {"Accept": "application/json"}
-    response = requests.request("GET", url, headers=headers)
+    response = get_response(url, headers=headers)
     
-    status_code = response.status_code
-    
-    if status_code==200:
+    if response != 'RequestsError':
         response_dict = json.loads(response.text)
         #print(f"{no_assets} assets succesfully retrieved")
         return response_dict["stats"]
         
     else:
-        print(f"Error {status_code} occured")
-        print(response.text)
+        print(f"Error occured for {url}")
         return {}
 
 
-def retrieve_asset_and_unpack(token_ids:list, collection:str, limit:int):
-    print(f"{token_ids[0]} - {token_ids[-1]} - {collection}")
-    response = get_assets(token_ids=token_ids, collection=collection, limit=limit)
-    assets = response["assets"]
-    return assets
+async def retrieve_asset_and_unpack(session, token_ids:list, collection:str, limit:int, cache_ttl=None):
+    '''
+    Performs async HTTP GET request on the shared session to retrieve one batch of assets. Returns list of assets
+    or None if the request failed. cache_ttl=0 bypasses asset pages of the http cache.
+    '''
+    url = f"{API_URL}/assets"
+    querystring = [("token_ids", str(token_id)) for token_id in token_ids]
+    querystring += [("collection", collection), ("limit", str(limit)), ("order_direction", "asc"), ("offset", "0")]
+    response = await fetch_json(session, url, params=querystring, cache_ttl=cache_ttl)
+    if not response:
+        return None
+    return response["assets"]
+
+
+async def stream_assets(collection:str, token_ids_lists:list, limit:int, concurrency:int, cache_ttl=None):
+    '''
+    Async generator that crawls all token id batches on one pooled session and yields (token_ids, assets) of each
+    batch as soon as its response arrives, assets is None if the batch failed.
+    '''
+    fetch = lambda session, token_ids: retrieve_asset_and_unpack(session, token_ids, collection, limit, cache_ttl)
+    async for token_ids, assets in crawl(token_ids_lists, fetch, concurrency=concurrency):
+        if assets is None:
+            print(f"{token_ids[0]} - {token_ids[-1]} - {collection}: failed")
+        else:
+            print(f"{token_ids[0]} - {token_ids[-1]} - {collection}: {len(assets)} assets")
+        yield token_ids, assets
+
+
+def get_minted_token_ids(collection:str, mints_path:str=None):
+    '''
+    Discovers the token ids of a collection from its mint and burn events (transfers from and to the null
+    address), paged with the cursor. Returns the sorted ids of all minted and not burned tokens or None if blocked.
+    The ids are kept with the time of the discovery in mints_path, later runs start from them and only page the
+    events since then.
+    '''
+    checkpoint = load_json(mints_path) if mints_path else {'Error': 'No mint checkpoint'}
+    occurred_after = None if 'Error' in checkpoint else checkpoint["occurred_after"] - MINTS_OVERLAP
+    started_at = time()
+    asset_events = []
+    cursor = None
+    while True:
+        response = get_events(collection, limit=50, event_type="transfer", account_address=NULL_ADDRESS, cursor=cursor,
+                              occurred_after=occurred_after)
+        if response is None:
+            return None
+        asset_events += response["asset_events"]
+        cursor = response.get("next")
+        if not cursor or not response["asset_events"]:
+            break
+
+    # events are newest first, replayed oldest first so a burn removes the token minted before it. Events of the
+    # overlap were already applied, replaying them again ends in the same state
+    token_ids = set() if occurred_after is None else set(checkpoint["token_ids"])
+    for event in reversed(asset_events):
+        if not event.get("asset"):
+            continue
+        token_id = int(event["asset"]["token_id"])
+        if (event.get("from_account") or {}).get("address") == NULL_ADDRESS:
+            token_ids.add(token_id)
+        elif (event.get("to_account") or {}).get("address") == NULL_ADDRESS:
+            token_ids.discard(token_id)
+    token_ids = sorted(token_ids)
+    if mints_path:
+        save_json({"occurred_after": started_at, "token_ids": token_ids}, mints_path)
+    return token_ids
+
+
+def get_token_ids_lists(collection:str, asset_count:int, batch_size:int=30):
+    '''
+    Packs the token ids of a collection into batches of batch_size for the asset api. The ids come from the
+    mint events, if that fails or finds fewer tokens than the collection has the contiguous ids 1..asset_count
+    are added, so no token is missed.
+    '''
+    token_ids = get_minted_token_ids(collection, MINTS_PATH)
+    if token_ids is None or len(token_ids) < asset_count:
+        print(f"Token id discovery found {len(token_ids or [])} of {asset_count} tokens, adding ids 1 - {asset_count}")
+        token_ids = sorted(set(token_ids or []) | set(range(1, asset_count + 1)))
+    return [token_ids[i:i+batch_size] for i in range(0, len(token_ids), batch_size)]
+
 
-def run_retrieve_assets(collection:str, n_jobs:int=6):
+def run_retrieve_assets(collection:str, n_jobs:int=6, on_assets=None, manifest=None):
     '''
     Loops through Opensea API Asset API until all assets from the specified collections are retrieved.
     Collection name needs to be specified as the unique collection slug (e.g. cryptopunks or )
-    '''    
+    n_jobs is the number of concurrent requests on the pooled session. If on_assets is given it is called
+    with every batch of assets as soon as it arrives.
+    Every batch is saved in the manifest (ScrapeManifest) as it arrives, batches that are done from a previous
+    run are not requested again and failed batches are retried for MAX_ROUNDS rounds. Once all batches are done
+    they are written to OUTPUT_PATH in token id order one batch file at a time. Returns the number of assets or
+    None if batches are still failing, a rerun with the same manifest retries only those.
+    '''
+    if manifest is None:
+        manifest = ScrapeManifest(MANIFEST_PATH, BATCH_PATH)
     stat_dict = get_stats(collection)
     asset_count = int(stat_dict["count"]) # total assets count in the collection from open sea
-    num_ids = 30 # max 30 token_ids as parameter allowed
-    start_token_id = 0
-    num_retrieved_assets = 0 # counter
-    iteration = 1
     no_assets_per_requests = 30 # limit of # arguments for token ids
-    max_iterations = int(np.ceil(asset_count/no_assets_per_requests))
-    
-    
-    token_ids_lists = []
-    for i in range(0, max_iterations):
-        start_token_id = i*30+1
-        end_token_id = start_token_id + no_assets_per_requests
-        token_ids = list(np.arange(start_token_id, end_token_id))
-        token_ids_lists.append(token_ids)
+
+    # the batches of a resumed scrape have to be the same as in the first run
+    if manifest.token_ids_lists is None:
+        manifest.token_ids_lists = get_token_ids_lists(collection, asset_count, no_assets_per_requests)
+        manifest.save()
+    token_ids_lists = manifest.token_ids_lists
+
+    async def consume(batches):
+        async for token_ids, assets in stream_assets(collection, batches, no_assets_per_requests, n_jobs):
+            if assets is None:
+                manifest.mark_failed(token_ids)
+                continue
+            manifest.save_batch(token_ids, assets)
+            if on_assets:
+                on_assets(assets)
 
     start_timer = time()
-    asset_list = [] # save responses in list
-    asset_list = Parallel(n_jobs=n_jobs, verbose=10)(delayed(retrieve_asset_and_unpack)\
-        (token_ids=i, collection=collection, limit=no_assets_per_requests) for i in token_ids_lists)
+    todo = [token_ids for token_ids in token_ids_lists if not manifest.is_done(token_ids)]
+    if len(todo) < len(token_ids_lists):
+        print(f"Resuming scrape: {len(token_ids_lists) - len(todo)} of {len(token_ids_lists)} batches already done")
+    for _ in range(MAX_ROUNDS):
+        if not todo:
+            break
+        asyncio.run(consume(todo))
+        todo = [token_ids for token_ids in todo if not manifest.is_done(token_ids)]
     end_timer = time()
     run_time = end_timer - start_timer
-    print(run_time)
+    if todo:
+        print(f"{len(todo)} batches failed, rerun to retry only these: {sorted(manifest.failed)}")
+        return None
 
-    flat_asset_list = [item for sublist in asset_list for item in sublist]
-    
-    num_retrieved_assets = len(flat_asset_list)
+    num_retrieved_assets = save_json_array(
+        (asset for token_ids in token_ids_lists for asset in manifest.load_batch(token_ids)), OUTPUT_PATH)
     print(
         f"Retrieved {num_retrieved_assets} assets from {asset_count} in {round(run_time,2)} s. Saved in {OUTPUT_PATH}")
-    return flat_asset_list
+    return num_retrieved_assets
+
+
+def get_changed_token_ids(collection:str, occurred_after:float):
+    '''
+    Pages through all events of a collection since the unix timestamp occurred_after and returns the set of
+    token_ids that were listed, sold, transferred or cancelled in the meantime. Returns None if blocked.
+    '''
+    token_ids = set()
+    cursor = None
+    while True:
+        response = get_events(collection, limit=50, occurred_after=occurred_after, cursor=cursor)
+        if response is None:
+            return None
+        for event in response["asset_events"]:
+            if event.get("asset"):
+                token_ids.add(event["asset"]["token_id"])
+            elif event.get("asset_bundle"):
+                token_ids.update(asset["token_id"] for asset in event["asset_bundle"]["assets"])
+        cursor = response.get("next")
+        if not cursor or not response["asset_events"]:
+            return token_ids
+
+
+def patch_asset_file(path:str, new_assets:list):
+    '''
+    Streams the stored assets of the json file in path and replaces the ones with the same token_id by the
+    refreshed ones, unknown ones are appended. Returns the token_ids of the patched file in order and whether new
+    assets were appended.
+    '''
+    new_by_id = {asset["token_id"]: asset for asset in new_assets}
+    token_ids = []
+    stored_count = 0
+
+    def patched_assets():
+        nonlocal stored_count
+        unknown = dict(new_by_id)
+        for asset in iter_json_array(path):
+            asset = unknown.pop(asset["token_id"], asset)
+            token_ids.append(asset["token_id"])
+            yield asset
+        stored_count = len(token_ids)
+        for asset in unknown.values():
+            token_ids.append(asset["token_id"])
+            yield asset
+
+    save_json_array(patched_assets(), path)
+    return token_ids, len(token_ids) > stored_count
+
+
+def patch_processed_data(df_processed, changed_assets:list, token_ids:list):
+    '''
+    Preprocesses only the changed assets and swaps their rows in the processed data frame. Traits do not change
+    between runs, so rarity score and rank are kept from the stored rows instead of being recomputed.
+    Rows are matched by token_id: an asset with several sell orders has several rows and the stored frame is
+    not indexed by asset position. The result is in the order of token_ids, the ids of all stored assets.
+    '''
+    df_changed = pd.DataFrame([slim_asset(asset) for asset in changed_assets])
+    df_changed = run_data_preprocessing(df_changed, collection_size=len(token_ids))
+    rarity = df_processed.drop_duplicates("token_id").set_index("token_id")
+    df_changed["rarity_score"] = df_changed["token_id"].map(rarity["rarity_score"])
+    df_changed["rarity_rank"] = df_changed["token_id"].map(rarity["rarity_rank"])
+    df_kept = df_processed[~df_processed["token_id"].isin(df_changed["token_id"])]
+    df = pd.concat([df_kept, df_changed], ignore_index=True)
+    positions = {token_id: i for i, token_id in enumerate(token_ids)}
+    # stable sort, the rows of one asset keep their order
+    order = df["token_id"].map(positions).sort_values(kind="stable").index
+    return df.loc[order, df_processed.columns].reset_index(drop=True)
+
+
+def run_incremental_refresh(collection:str, n_jobs:int=6):
+    '''
+    Re-fetches only the assets that had events since the last checkpoint and patches the stored json and
+    processed data in place. Returns False if there is no stored dataset or checkpoint to refresh from.
+    '''
+    checkpoint = load_json(CHECKPOINT_PATH)
+    if "Error" in checkpoint or not os.path.exists(OUTPUT_PATH) or not collection_exists(collection):
+        return False
+
+    start_timer = time()
+    token_ids = get_changed_token_ids(collection, checkpoint["occurred_after"])
+    if token_ids is None:
+        print("Blocked request while reading events, checkpoint kept for the next run")
+        return True
+    print(f"{len(token_ids)} assets changed since last checkpoint")
+
+    if token_ids:
+        token_ids = sorted(token_ids, key=int)
+        token_ids_lists = [token_ids[i:i+30] for i in range(0, len(token_ids), 30)]
+
+        async def consume():
+            # changed assets have to come from the api, not from the http cache
+            async for token_ids, assets in stream_assets(collection, token_ids_lists, 30, n_jobs, cache_ttl=0):
+                if assets is None:
+                    failed.append(token_ids)
+                else:
+                    new_assets.extend(assets)
+
+        new_assets, failed = [], []
+        asyncio.run(consume())
+
+        # the stored assets are streamed through, never loaded at once
+        stored_token_ids, appended = patch_asset_file(OUTPUT_PATH, new_assets)
+
+        if appended: # new tokens need collection wide rarity scores
+            run_streaming_preprocessing(OUTPUT_PATH, collection, data_path=DATA_PATH)
+        elif new_assets:
+            changed_assets = list({asset["token_id"]: asset for asset in new_assets}.values())
+            df = patch_processed_data(load_collection(collection), changed_assets, stored_token_ids)
+            save_collection(df, collection)
+
+    if token_ids and failed:
+        # the changed assets of failed batches are only requested again if the checkpoint stays where it is
+        print(f"{len(failed)} batches failed, checkpoint kept for the next run")
+        return True
+    save_json({"occurred_after": start_timer}, CHECKPOINT_PATH)
+    print(f"Incremental refresh run in {round(time()-start_timer, 2)}s for: {collection}")
+    return True
 
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser()
     parser.add_argument('--collection', type=str, help='slug name of collection', default="")
-    parser.add_argument('--njobs', type=int, help='Number of threads for API requests', default=None)
+    parser.add_argument('--njobs', type=int, help='Number of concurrent API requests', default=None)
+    parser.add_argument('--incremental', action='store_true', help='Only refresh assets with events since the last run')
     args = parser.parse_args()
 
     collection = args.collection
     if collection:
         COLLECTION = collection
         OUTPUT_PATH = f'../Data/{COLLECTION}.json'
+        CHECKPOINT_PATH = f'../Data/{COLLECTION}_checkpoint.json'
+        MANIFEST_PATH = f'../Data/{COLLECTION}_manifest.json'
+        BATCH_PATH = f'../Data/{COLLECTION}_batches'
+        MINTS_PATH = f'../Data/{COLLECTION}_mints.json'
 
 
     N_JOBS = 5
@@ -181,22 +395,29 @@ if __name__ == '__main__':
     if njobs:
         N_JOBS = njobs
 
-    print(f"START Data Ingestion for: {COLLECTION}")
-    asset_list = run_retrieve_assets(COLLECTION, N_JOBS)
-    # save output
-    with open(OUTPUT_PATH, 'w') as fp:
-        json.dump(asset_list, fp)
+    refreshed = False
+    if args.incremental:
+        print(f"START Incremental Refresh for: {COLLECTION}")
+        refreshed = run_incremental_refresh(COLLECTION, N_JOBS)
+        if not refreshed:
+            print("No checkpoint found, falling back to full scrape")
 
+    if not refreshed:
+        print(f"START Data Ingestion for: {COLLECTION}")
+        # resumes a scrape that failed or was interrupted before
+        manifest = ScrapeManifest(MANIFEST_PATH, BATCH_PATH)
+        # the batches are written to OUTPUT_PATH one at a time
+        if run_retrieve_assets(COLLECTION, N_JOBS, manifest=manifest) is None:
+            raise SystemExit(1)
 
-    print(f"START Data Preprocessing for: {COLLECTION}")
-    start_timer = time()
-    df = pd.DataFrame(asset_list)
-    df = run_data_preprocessing(df)
-    
-    end_timer = time()
-    run_time = end_timer-start_timer
-    # save data as csv
-    OUTPUT_PATH_PROCESSED = f'../Data/{COLLECTION}_processed.pkl'
 
-    df.to_pickle(OUTPUT_PATH_PROCESSED)
-    print(f"Data Preprocessing run in {round(run_time, 2)}s and saved in: {OUTPUT_PATH_PROCESSED}")
+        print(f"START Data Preprocessing for: {COLLECTION}")
+        start_timer = time()
+        # stream the dump back in chunks instead of building one data frame with all nested fields
+        output_path_processed = run_streaming_preprocessing(OUTPUT_PATH, COLLECTION, data_path=DATA_PATH)
+        
+        end_timer = time()
+        run_time = end_timer-start_timer
+        save_json({"occurred_after": manifest.started_at}, CHECKPOINT_PATH)
+        manifest.remove()
+        print(f"Data Preprocessing run in {round(run_time, 2)}s and saved in: {output_path_processed}")
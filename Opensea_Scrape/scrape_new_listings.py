@@ -1,102 +1,117 @@
-import requests
 import os
 import argparse
 import pandas as pd
-import time 
-from time import sleep
-import traceback
+import asyncio
 from dotenv import load_dotenv
-import warnings
-from random import randint
+from Functions.change_feed import publish_version
+from Functions.event_feed import EventFeed
+from Functions.listing_events import decode_listing_events
+from Functions.collection_store import collection_exists, get_collection_columns, load_collection
+from Functions.trait_floor_index import TraitFloorIndex
+from Functions.monitor import Monitor, run_monitors, MAX_WORKERS
+from Functions.metrics import start_metrics_server, LISTING_LAG_SECONDS
 
-warnings.filterwarnings("ignore")
+DATA_PATH = '../Data'
+# collections the poller watches and the seconds between two polls of each
+COLLECTIONS = {"jankyheist": 10, "clonex": 10, "huxley": 10}
+REMOVAL_EVENT_TYPES = ('cancelled', 'successful')  # events that end a listing, only used for the floor index
+ROLLING_SIZE = 500 # newest listings kept per collection
+METRICS_PORT = '9109' # next to the alert daemon on 9108
 
-global COLLECTION
-COLLECTION = "jankyheist" # "cryptopunks", "boredapeyachtclub"
-OUTPUT_PATH = f'../Data/{COLLECTION}_newest_listings.pkl'
+load_dotenv() # opensea api key of the event feeds
 
-load_dotenv()
-OPENSEA_APIKEY = str(os.getenv('OPENSEA_APIKEY'))    
-SLEEP = 10
 
-
-def write_dummy_file():
-    # dummpy .py file to import in streamlit app, so that it refreshes the app
-    filePath = '../dummy.py'
-    with open(filePath, 'w') as f:
-        f.write(f'# Dummy file to be overwritten by scrape_new_listings.py and imported in streamlit app dashboard.py \n')
-        f.write(f'# so that it detects new changes in source code and refreshes the app with new data \n')
-        f.write(f'# Random Number: {randint(0, 10000)}')
-
-def get_events(collection_slug, limit=300, offset=0, json_file="", event_type=''):
+def get_floor_index(collection):
     '''
-    Perform HTTP Get Request to get current events on open sea for a given collection
+    Builds the live trait floor index from the stored sell orders of a processed collection, None if the collection
+    was not scraped yet
     '''
-    url = "https://api.opensea.io/api/v1/events"
-    querystring = {
-        "collection_slug":collection_slug,
-        "only_opensea":"false", 
-        "offset":"{}".format(offset), 
-        "limit":"{}".format(limit), 
-                  }
-    
-    if event_type != '':
-        querystring['event_type'] = event_type
-
-    apikey = OPENSEA_APIKEY
-    headers = None if apikey == "" else {"X-API-KEY": apikey}
-    response = requests.request("GET", url, headers=headers, params=querystring)
-
-    if "<!doctype html>" in response.text[:20].lower():
-        return None # blocked request
-    return response.json()
-    
-def get_new_listings(collection, limit=30):
+    if not collection_exists(collection, DATA_PATH):
+        return None
+    columns = [
+        col for col in get_collection_columns(collection, DATA_PATH)
+        if col.startswith("Trait_") or col in ("token_id", "payment_token_sell_order", "current_price", "created_date_sell_order")
+    ]
+    return TraitFloorIndex.from_collection(load_collection(collection, columns=columns, data_path=DATA_PATH))
+
+
+def save_versioned_pickle(save_obj, str_file_path):
+    '''writes next to the old file and swaps it in, then notifies the dashboard with a new version stamp'''
+    pd.to_pickle(save_obj, str_file_path + '.tmp')
+    os.replace(str_file_path + '.tmp', str_file_path)
+    publish_version(str_file_path)
+
+
+class ListingPoller:
     '''
-    Get the newest listings for a collection as a pd.Dataframe for a collection
+    Polls the listings of one collection. Only listings after the high-water mark of the created events are
+    requested, they are prepended to the rolling store of the newest ROLLING_SIZE listings, which is only written
+    when a new listing arrived or on the first poll without a store. The live trait floors are updated from the
+    same events plus cancels and sales.
     '''
-    ETH_NORM_CONSTANT = 1000000000000000000
-    # get data via opensea api
-    opensea_response = get_events(collection, limit=limit, event_type="created")
-    #cleaned_response = clean_response(opensea_response)
-    # turn json in dataframe
-    df_new_list = pd.DataFrame(opensea_response["asset_events"])
-    # some parsing and cleaning
-    df_new_list["token_id"] = df_new_list['asset'].apply(pd.Series)["token_id"].astype(int)
-    df_new_list["payment_token_symbol"] = df_new_list["payment_token"].apply(lambda x: x["symbol"])
-    cols = [ "token_id","event_type", "created_date", "starting_price", "ending_price", "payment_token_symbol"]
-    df_rec_listings = df_new_list[cols]
-    df_rec_listings["starting_price"] = df_rec_listings["starting_price"].astype(float)/ETH_NORM_CONSTANT
-    df_rec_listings["ending_price"] = df_rec_listings["ending_price"].astype(float)/ETH_NORM_CONSTANT
-    df_rec_listings["token_id"] = df_rec_listings["token_id"].astype(int)
-    
-    df_rec_listings['created_date'] = pd.to_datetime(df_rec_listings['created_date'], format='%Y-%m-%d %H:%M')
-#    df_rec_listings['listing_date'] = pd.to_datetime(df_rec_listings['listing_date'])
-    
-    return df_rec_listings
-
-
-def main(collection=COLLECTION, time_intervall=SLEEP):
-    while True:
-        try:
-            print(time.strftime('%X %x %Z'), ": Fetch newest listing events on OS for", COLLECTION)
-            df_rec_listings = get_new_listings(collection)
-            df_rec_listings.to_pickle(OUTPUT_PATH)
-            write_dummy_file()
-            sleep(time_intervall)
-        except Exception:
-            print(traceback.print_exc())
-            print('Restarting...')
-            sleep(time_intervall)
+
+    def __init__(self, collection):
+        self.collection    = collection
+        self.output_path   = f'{DATA_PATH}/{collection}_newest_listings.pkl'
+        self.floors_path   = f'{DATA_PATH}/{collection}_trait_floors.pkl'
+        self.listing_feed  = EventFeed(collection, 'created', f'{DATA_PATH}/{collection}_listings_feed.pickle')
+        self.floor_index   = get_floor_index(collection)
+        self.removal_feeds = [EventFeed(collection, event_type) for event_type in REMOVAL_EVENT_TYPES]
+        self.df_listings   = pd.read_pickle(self.output_path) if os.path.exists(self.output_path) else None
+
+    def poll(self):
+        # without listings the newest page of the first poll seeds the store (also written empty, e.g. for a quiet
+        # collection), these listings are older than the floor index and not applied to it
+        seed = self.listing_feed.watermark is None and (self.df_listings is None or self.df_listings.empty)
+        events = self.listing_feed.poll(include_first_page=seed)
+        if seed:
+            if events or self.df_listings is None:
+                print(f"{self.collection}: {len(events)} listings in the new store")
+                self.df_listings = decode_listing_events(events[::-1])
+                save_versioned_pickle(self.df_listings, self.output_path)
+            events = []
+        elif events:
+            print(f"{self.collection}: {len(events)} new listings")
+            df_new_listings = decode_listing_events(events[::-1]) # newest first like the store
+            lag = pd.Timestamp.utcnow().tz_localize(None) - df_new_listings["created_date"] # created_date is UTC
+            for seconds in lag.dt.total_seconds():
+                LISTING_LAG_SECONDS.observe(seconds, collection=self.collection)
+            self.df_listings = pd.concat([df_new_listings, self.df_listings]).head(ROLLING_SIZE).reset_index(drop=True)
+            save_versioned_pickle(self.df_listings, self.output_path)
+
+        if self.floor_index is None:
+            return
+        events += [event for feed in self.removal_feeds for event in feed.poll()]
+        if events:
+            for event in events:
+                self.floor_index.apply_event(event)
+            floors = {trait: self.floor_index.get_floors(trait) for trait in self.floor_index.get_traits()}
+            save_versioned_pickle(floors, self.floors_path)
+
+
+def main(collections=COLLECTIONS, max_workers=MAX_WORKERS, metrics_port=METRICS_PORT):
+    monitors = [
+        Monitor(f'{collection} listings', collection, interval, ListingPoller(collection).poll)
+        for collection, interval in collections.items()
+    ]
+    print(f"START Listing Poller for {len(monitors)} collections: {monitors}")
+    start_metrics_server(metrics_port)
+    asyncio.run(run_monitors(monitors, max_workers))
+
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser()
-    parser.add_argument('--collection', type=str, help='slug name of collection', default="")
+    parser.add_argument('--collections', '--collection', type=str, default="",
+                        help='comma separated slug names of collections, optionally with poll interval, e.g. clonex:10,huxley:30')
+    parser.add_argument('--interval', type=int, help='default seconds between two polls of a collection', default=10)
+    parser.add_argument('--metrics-port', type=str, help='Port of the /metrics endpoint, empty to disable', default=METRICS_PORT)
     args = parser.parse_args()
 
-    collection = args.collection
-    if collection:
-        COLLECTION = collection
-        OUTPUT_PATH = f'../Data/{COLLECTION}_newest_listings.pkl'
+    collections = COLLECTIONS
+    if args.collections:
+        collections = {}
+        for collection in args.collections.split(','):
+            slug, _, interval = collection.partition(':')
+            collections[slug] = int(interval or args.interval)
 
-    main(COLLECTION, SLEEP)
+    main(collections, metrics_port=args.metrics_port)
@@ -0,0 +1,60 @@
+import json
+import multiprocessing
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+from benchmarks.synthetic import generate_assets, generate_listing_events
+
+
+class MockOpenseaHandler(BaseHTTPRequestHandler):
+    '''
+    Serves /api/v1/assets (token_ids), /api/v1/events (cursor pages) and /api/v1/collection/<slug>/stats
+    from payloads that are serialized once at startup, so the server costs as little as possible per request.
+    '''
+    protocol_version = 'HTTP/1.1'  # keep-alive like the real api
+
+    def do_GET(self):
+        url   = urlparse(self.path)
+        query = parse_qs(url.query)
+        if url.path == '/api/v1/assets':
+            assets = [self.server.assets[token_id] for token_id in query.get('token_ids', []) if token_id in self.server.assets]
+            body = b'{"next": null, "previous": null, "assets": [' + b','.join(assets) + b']}'
+        elif url.path == '/api/v1/events':
+            start = int(query.get('cursor', query.get('offset', ['0']))[0])
+            limit = int(query.get('limit', ['50'])[0])
+            events = self.server.events[start:start + limit]
+            cursor = str(start + limit) if start + limit < len(self.server.events) else None
+            body = b'{"next": ' + json.dumps(cursor).encode() + b', "asset_events": [' + b','.join(events) + b']}'
+        elif url.path.startswith('/api/v1/collection/'):
+            body = json.dumps({"stats": {"count": len(self.server.assets)}}).encode()
+        else:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve(n_items, seed, ready):
+    server = ThreadingHTTPServer(('127.0.0.1', 0), MockOpenseaHandler)
+    server.daemon_threads = True
+    server.assets = {asset["token_id"]: json.dumps(asset).encode() for asset in generate_assets(n_items, seed)}
+    server.events = [json.dumps(event).encode() for event in generate_listing_events(n_items, seed)]
+    ready.send(server.server_address[1])
+    server.serve_forever()
+
+
+def start_mock_server(n_items, seed=0):
+    '''
+    Starts the mock api for a synthetic collection in its own process, so it does not compete with the measured
+    code for the GIL. Returns the base url to use instead of https://api.opensea.io/api/v1 and the process.
+    '''
+    receiver, sender = multiprocessing.Pipe(duplex=False)
+    process = multiprocessing.Process(target=serve, args=(n_items, seed, sender), daemon=True)
+    process.start()
+    port = receiver.recv()
+    return f"http://127.0.0.1:{port}/api/v1", process
@@ -0,0 +1,222 @@
+import os
+import sys
+import json
+import asyncio
+import argparse
+import contextlib
+import threading
+import multiprocessing
+from time import perf_counter
+import pandas as pd
+from Functions import http_cache, rate_limiter
+from Functions.dashboard_data import DashboardData
+from Functions.listing_events import decode_listing_events
+import Opensea_Scrape.scrape_collection as scrape_collection
+from Opensea_Scrape.preprocess import run_data_preprocessing, process_sell_orders, process_last_sales, slim_asset
+from benchmarks.synthetic import generate_assets, generate_listing_events
+from benchmarks.mock_server import start_mock_server
+
+SIZES         = [1000, 10000, 100000]
+REPEAT        = 3
+SEED          = 0
+CONCURRENCY   = 6
+RSS_INTERVAL  = 0.001  # seconds between two rss samples of the memory run
+PAGE_SIZE     = os.sysconf('SC_PAGE_SIZE')
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+
+
+def get_asset_frame(n_items, seed):
+    return pd.DataFrame([slim_asset(asset) for asset in generate_assets(n_items, seed)])
+
+
+def use_mock_server(n_items, seed):
+    '''points the scrape functions to a mock api without rate limit, returns the server process'''
+    url, process = start_mock_server(n_items, seed)
+    scrape_collection.API_URL = url
+    rate_limiter.RATE_LIMITS[url.split('/')[2]] = 1000000
+    return process
+
+
+# every stage prepares its input untimed and returns the timed call and the number of items it processes
+
+def stage_crawl(n_items, seed):
+    use_mock_server(n_items, seed)
+    token_ids = [str(token_id) for token_id in range(1, n_items + 1)]
+    token_ids_lists = [token_ids[i:i+30] for i in range(0, len(token_ids), 30)]
+
+    async def consume():
+        assets = []
+        async for _, batch in scrape_collection.stream_assets("synthetic", token_ids_lists, 30, CONCURRENCY):
+            assets.extend(batch)
+        assert len(assets) == n_items, f"crawled {len(assets)} of {n_items} assets"
+
+    return lambda: asyncio.run(consume()), n_items
+
+
+def stage_events(n_items, seed):
+    use_mock_server(n_items, seed)
+    n_events = len(generate_listing_events(n_items, seed))
+
+    def page_events():
+        asset_events, cursor = [], None
+        while True:
+            response = scrape_collection.get_events("synthetic", limit=50, event_type="created", cursor=cursor)
+            asset_events += response["asset_events"]
+            cursor = response.get("next")
+            if not cursor:
+                return decode_listing_events(asset_events)
+
+    return page_events, n_events
+
+
+def stage_run_data_preprocessing(n_items, seed):
+    df = get_asset_frame(n_items, seed)
+    return lambda: run_data_preprocessing(df), n_items
+
+
+def stage_process_sell_orders(n_items, seed):
+    df = get_asset_frame(n_items, seed)
+    return lambda: process_sell_orders(df), n_items
+
+
+def stage_process_last_sales(n_items, seed):
+    df = get_asset_frame(n_items, seed)
+    return lambda: process_last_sales(df), n_items
+
+
+def stage_dashboard_groupby(n_items, seed):
+    df = run_data_preprocessing(get_asset_frame(n_items, seed))
+    return lambda: DashboardData(df), n_items
+
+
+def stage_dashboard_merge(n_items, seed):
+    data = DashboardData(run_data_preprocessing(get_asset_frame(n_items, seed)))
+    df_listings = decode_listing_events(generate_listing_events(n_items, seed))
+    return lambda: data.join_listings(df_listings), len(df_listings)
+
+
+STAGES = {
+    "crawl":                  stage_crawl,
+    "events":                 stage_events,
+    "run_data_preprocessing": stage_run_data_preprocessing,
+    "process_sell_orders":    stage_process_sell_orders,
+    "process_last_sales":     stage_process_last_sales,
+    "dashboard_groupby":      stage_dashboard_groupby,
+    "dashboard_merge":        stage_dashboard_merge,
+}
+
+
+def measure_stage(stage, n_items, seed, repeat, result):
+    '''
+    runs in its own process: one untimed run samples the RSS, so the reported memory is the growth over the RSS
+    before run() and excludes imports and the input, then the timed runs
+    '''
+    http_cache.CACHE_PATH = ''
+    run, items = STAGES[stage](n_items, seed)
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):  # progress prints of the scrape
+        run_rss = sampled_rss(run)
+        seconds = min(timed(run) for _ in range(repeat))
+    result.send({"items": items, "seconds": seconds, "items_per_s": items / seconds, "run_rss_mb": run_rss})
+    for child in multiprocessing.active_children():
+        child.terminate()
+
+
+def get_rss():
+    '''resident set size of this process in bytes (linux)'''
+    with open('/proc/self/statm') as f:
+        return int(f.read().split()[1]) * PAGE_SIZE
+
+
+def sampled_rss(run):
+    '''returns the peak RSS in MB while run() runs minus the RSS before, sampled from a thread'''
+    start_rss = peak_rss = get_rss()
+    done = threading.Event()
+
+    def sample():
+        nonlocal peak_rss
+        while not done.wait(RSS_INTERVAL):
+            peak_rss = max(peak_rss, get_rss())
+
+    sampler = threading.Thread(target=sample, daemon=True)
+    sampler.start()
+    try:
+        run()
+    finally:
+        done.set()
+        sampler.join()
+    peak_rss = max(peak_rss, get_rss())
+    return (peak_rss - start_rss) / 2**20
+
+
+def timed(run):
+    start = perf_counter()
+    run()
+    return perf_counter() - start
+
+
+def run_stage(stage, n_items, seed=SEED, repeat=REPEAT):
+    context = multiprocessing.get_context('spawn')
+    receiver, sender = context.Pipe(duplex=False)
+    process = context.Process(target=measure_stage, args=(stage, n_items, seed, repeat, sender))
+    process.start()
+    result = receiver.recv()
+    process.join()
+    return result
+
+
+def get_delta(value, baseline_value):
+    return (value - baseline_value) / baseline_value
+
+
+def print_report(results, baseline):
+    print(f"{'stage':<24}{'items':>8}{'seconds':>10}{'items/s':>12}{'run RSS MB':>13}{'time Δ':>9}{'RSS Δ':>9}")
+    for key, result in results.items():
+        stage = key.split('/')[0]
+        line = (f"{stage:<24}{result['items']:>8}{result['seconds']:>10.3f}{result['items_per_s']:>12.0f}"
+                f"{result['run_rss_mb']:>13.1f}")
+        if key in baseline:
+            line += f"{get_delta(result['seconds'], baseline[key]['seconds']):>+9.1%}"
+            # baselines saved before the rss of run() was measured have no run_rss_mb
+            if baseline[key].get('run_rss_mb', 0) > 0:
+                line += f"{get_delta(result['run_rss_mb'], baseline[key]['run_rss_mb']):>+9.1%}"
+        print(line)
+
+
+def get_regressions(results, baseline, max_regression):
+    return [
+        key for key, result in results.items()
+        if key in baseline and get_delta(result['seconds'], baseline[key]['seconds']) > max_regression
+    ]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Times the scrape, preprocess and dashboard stages on synthetic collections')
+    parser.add_argument('--sizes', type=int, nargs='+', help='Number of assets of the synthetic collections', default=SIZES)
+    parser.add_argument('--stages', nargs='+', choices=list(STAGES), help='Stages to run', default=list(STAGES))
+    parser.add_argument('--repeat', type=int, help='Timed runs per stage, the fastest one is reported', default=REPEAT)
+    parser.add_argument('--baseline', type=str, help='Json file with the results to compare to', default=BASELINE_PATH)
+    parser.add_argument('--save-baseline', action='store_true', help='Store the results as new baseline')
+    parser.add_argument('--max-regression', type=float, help='Fail if a stage is slower than the baseline by this share, e.g. 0.2', default=None)
+    args = parser.parse_args()
+
+    results = {}
+    for n_items in args.sizes:
+        for stage in args.stages:
+            print(f"Running {stage} with {n_items} assets")
+            results[f"{stage}/{n_items}"] = run_stage(stage, n_items, repeat=args.repeat)
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline, 'r') as f:
+            baseline = json.load(f)
+    print_report(results, baseline)
+
+    if args.save_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump({**baseline, **results}, f, indent=4)
+        print(f"Baseline saved in: {args.baseline}")
+    if args.max_regression is not None:
+        regressions = get_regressions(results, baseline, args.max_regression)
+        if regressions:
+            print(f"Slower than the baseline by more than {args.max_regression:.0%}: {', '.join(regressions)}")
+            sys.exit(1)
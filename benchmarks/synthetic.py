@@ -0,0 +1,95 @@
+import random
+from datetime import datetime, timedelta
+
+# shape of the synthetic collections, roughly like clonex: a handful of traits with skewed value counts
+TRAIT_TYPES   = ["Type", "Eyes", "Mouth", "Hair", "Clothing", "Accessory", "Background", "Level"]
+TRAIT_VALUES  = 25     # values per trait type, drawn with zipf like weights
+LISTED_SHARE  = 0.15   # assets with a sell order
+SOLD_SHARE    = 0.6    # assets with a last sale
+WETH_SHARE    = 0.1    # listings and sales in WETH instead of ETH
+EVENT_SHARE   = 0.1    # created events per asset
+START_DATE    = datetime(2022, 1, 1)
+WEI_PER_GWEI  = 1000000000
+
+
+def get_date(rng, days=30):
+    return (START_DATE + timedelta(seconds=rng.randrange(days * 24 * 3600))).strftime("%Y-%m-%dT%H:%M:%S.%f")
+
+
+def get_price_wei(rng):
+    '''a price between 0.05 and 50 ETH as wei string, whole gwei like the listings of the api'''
+    return str(int(rng.lognormvariate(0.5, 1.2) * 1e9 + 5e7) * WEI_PER_GWEI)
+
+
+def get_payment_token(rng):
+    return {"symbol": "WETH" if rng.random() < WETH_SHARE else "ETH", "decimals": 18}
+
+
+def generate_traits(rng, n_items):
+    '''draws the traits of every asset and sets trait_count to the number of assets with that value'''
+    weights = [1 / (rank + 1) for rank in range(TRAIT_VALUES)]
+    assets_traits = []
+    counts = {}
+    for _ in range(n_items):
+        traits = []
+        for trait_type in TRAIT_TYPES:
+            if trait_type == "Accessory" and rng.random() < 0.3:
+                continue
+            value = f"{trait_type} {rng.choices(range(TRAIT_VALUES), weights)[0]}"
+            traits.append({"trait_type": trait_type, "value": value, "display_type": None, "max_value": None})
+            counts[value] = counts.get(value, 0) + 1
+        assets_traits.append(traits)
+    for traits in assets_traits:
+        for trait in traits:
+            trait["trait_count"] = counts[trait["value"]]
+    return assets_traits
+
+
+def generate_assets(n_items, seed=0, collection="synthetic"):
+    '''
+    Returns n_items assets shaped like the responses of the opensea asset api, with the fields the scrape keeps
+    and some of the ones it drops. The same seed gives the same collection.
+    '''
+    rng = random.Random(seed)
+    assets = []
+    for token_id, traits in enumerate(generate_traits(rng, n_items), start=1):
+        sell_orders = None
+        if rng.random() < LISTED_SHARE:
+            sell_orders = [{
+                "created_date": get_date(rng), "closing_date": get_date(rng, 90) if rng.random() < 0.5 else None,
+                "current_price": get_price_wei(rng) + ".000000000000000000", "payment_token_contract": get_payment_token(rng),
+                "quantity": "1", "maker": {"address": f"0x{rng.getrandbits(160):040x}"}, "side": 1, "sale_kind": 0,
+            }]
+        last_sale = None
+        if rng.random() < SOLD_SHARE:
+            last_sale = {
+                "event_timestamp": get_date(rng), "created_date": get_date(rng), "payment_token": get_payment_token(rng),
+                "total_price": get_price_wei(rng), "quantity": "1", "event_type": "successful",
+                "transaction": {"transaction_hash": f"0x{rng.getrandbits(256):064x}"},
+            }
+        assets.append({
+            "id": token_id, "token_id": str(token_id), "name": f"{collection} #{token_id}",
+            "description": f"{collection} token {token_id}",
+            "permalink": f"https://opensea.io/assets/0x49cf6f5d44e70224e2e23fdcdd2c053f30ada28b/{token_id}",
+            "image_url": f"https://img.example/{collection}/{token_id}.png",
+            "image_thumbnail_url": f"https://img.example/{collection}/{token_id}_thumb.png",
+            "asset_contract": {"address": "0x49cf6f5d44e70224e2e23fdcdd2c053f30ada28b", "schema_name": "ERC721"},
+            "owner": {"address": f"0x{rng.getrandbits(160):040x}"},
+            "traits": traits, "sell_orders": sell_orders, "last_sale": last_sale,
+        })
+    return assets
+
+
+def generate_listing_events(n_items, seed=0):
+    '''Returns created events of the opensea events api for the assets of generate_assets, newest first'''
+    rng = random.Random(seed + 1)
+    events = []
+    for event_id in range(int(n_items * EVENT_SHARE) or 1):
+        price = get_price_wei(rng)
+        events.append({
+            "id": event_id, "event_type": "created", "created_date": get_date(rng),
+            "starting_price": price, "ending_price": price, "payment_token": get_payment_token(rng),
+            "asset": {"token_id": str(rng.randrange(1, n_items + 1))}, "asset_bundle": None,
+        })
+    events.sort(key=lambda event: event["created_date"], reverse=True)
+    return events
@@ -10,8 +10,12 @@ import time
 from datetime import datetime
 import plotly.express as px
 from Opensea_Scrape.scrape_collection import get_new_listings
+from Functions.collection_store import collection_exists, get_collection_columns, get_collection_version, load_collection
+from Functions.change_feed import read_version, wait_for_version
+from Functions.dashboard_data import DashboardData
+from Functions.listing_events import decode_listing_events
+from Functions.snipe_rules import load_snipe_rules, get_snipe_mask
 import os
-from dummy import * # workaround for autorefresh, file gest overwritten and app should refresh
 
 # Add a selectbox to the sidebar:
 COLLECTION = st.sidebar.selectbox(
@@ -19,10 +23,40 @@ COLLECTION = st.sidebar.selectbox(
     ('jankyheist', 'clonex', 'huxley')
 )
 
-IMPUT_PATH_COLLECTION = f'Data/{COLLECTION}_processed.pkl'
-df = pd.read_pickle(IMPUT_PATH_COLLECTION)
-df["token_id"] = df["token_id"].astype(int)
-df_fixed_price_listings = df[df["payment_token_sell_order"]=="ETH"]
+DATA_PATH = 'Data'
+# only the columns displayed below are read from the columnar store
+DASHBOARD_COLUMNS = [
+    "token_id", "image_thumbnail_url", "permalink", "payment_token_sell_order", "current_price",
+    "last_sale_price", "event_timestamp", "rarity_rank", "rarity_score"
+]
+
+# cached per collection and version of its data file, reruns after a widget interaction only do lookups
+@st.cache(allow_output_mutation=True, show_spinner=False, max_entries=10)
+def get_dashboard_data(collection, version):
+    if collection_exists(collection, DATA_PATH):
+        STORED_COLUMNS = get_collection_columns(collection, DATA_PATH)
+        columns = [col for col in STORED_COLUMNS if col in DASHBOARD_COLUMNS or col.startswith("Trait_")]
+        df = load_collection(collection, columns=columns, data_path=DATA_PATH)
+    else: # collections processed before the columnar store
+        df = pd.read_pickle(f'{DATA_PATH}/{collection}_processed.pkl')
+    return DashboardData(df)
+
+@st.cache(allow_output_mutation=True, show_spinner=False, max_entries=10)
+def get_recent_listings(path, version):
+    if version is None: # scrape_new_listings.py did not write the store yet
+        return decode_listing_events([])
+    return pd.read_pickle(path)
+
+@st.cache(allow_output_mutation=True, show_spinner=False, max_entries=10)
+def get_trait_floors(path, version):
+    return pd.read_pickle(path)
+
+if collection_exists(COLLECTION, DATA_PATH):
+    data_version = get_collection_version(COLLECTION, DATA_PATH)
+else:
+    data_version = os.stat(f'{DATA_PATH}/{COLLECTION}_processed.pkl').st_mtime_ns
+data = get_dashboard_data(COLLECTION, data_version)
+df = data.df
 COLLECTION_DEFAULT_TRAIT = {
     "jankyheist":"Trait_Jankyness_Level",
     "clonex": "Trait_DNA"
@@ -30,10 +64,12 @@ COLLECTION_DEFAULT_TRAIT = {
 
 # Recent Listings Snipe Table
 IMPUT_PATH_REC_LISTINGS = f'Data/{COLLECTION}_newest_listings.pkl'
-df_rec_listings = pd.read_pickle(IMPUT_PATH_REC_LISTINGS)
-timestamp_recent_listings = os.path.getctime(IMPUT_PATH_REC_LISTINGS)
+RECENT_LISTINGS = 30 # rows shown of the rolling listings store
+LISTINGS_WAIT_SECONDS = 1 # max time between st calls while waiting for new listings
+# live floors per trait value, kept up to date by scrape_new_listings.py
+IMPUT_PATH_TRAIT_FLOORS = f'Data/{COLLECTION}_trait_floors.pkl'
 
-TRAIT_OPTIONS = list(df.columns[df.columns.str.contains("Trait")]) # get extracted traits
+TRAIT_OPTIONS = data.traits
 
 DEFAULT_TRAIT = TRAIT_OPTIONS.index(COLLECTION_DEFAULT_TRAIT[COLLECTION])
 
@@ -43,28 +79,11 @@ TRAIT = st.sidebar.selectbox(
 )
 
 TRAIT_OPTION_VALUES = [None]
-TRAIT_OPTION_VALUES = TRAIT_OPTION_VALUES + list(df[TRAIT].unique())
+TRAIT_OPTION_VALUES = TRAIT_OPTION_VALUES + data.trait_values[TRAIT]
 
 
 
 
-def get_snipe_criteria(df_snipe):
-    if COLLECTION == "jankyheist":
-        price_thres_dic = {
-            "Level 7": 0.25, "Level 6": 1, "Level 5": 0.7, "Level 4": 1,
-            "Level 3": 0.4, "Level 2": 1, "Level 1": 1,
-        }
-        price_thresholds = df_snipe["Trait_Jankyness_Level"].apply(lambda x: price_thres_dic[x])
-         #only fixed price listings that are below the set thresholds per Jankyness Level
-        snipe_criteria = ((df_snipe["payment_token_symbol"]=="ETH") \
-                            & (df_snipe["starting_price"]<= price_thresholds) )
-        return snipe_criteria
-    if COLLECTION == "clonex":
-        price_threshold = 2.5 #flat threshold
-        snipe_criteria = ((df_snipe["payment_token_symbol"]=="ETH") \
-                    & (df_snipe["starting_price"]<= price_threshold))
-        return snipe_criteria
-
 def path_to_image_html(path):
     '''
      This function essentially convert the image url to 
@@ -80,28 +99,52 @@ def path_to_image_html(path):
 
 st.header(f'Dashboard - {COLLECTION}')
 st.subheader(f"Floor by Trait: {TRAIT}")
-st.dataframe(df_fixed_price_listings[["current_price", TRAIT]].groupby([TRAIT]).min()[["current_price"]].T)
+floor_panel = st.empty()
+
+def get_floors():
+    # falls back to the floors of the stored sell orders as long as no live floors were published
+    floors_version = read_version(IMPUT_PATH_TRAIT_FLOORS)
+    if floors_version is None:
+        return data.floors
+    return get_trait_floors(IMPUT_PATH_TRAIT_FLOORS, floors_version)
+
+def render_floor(panel):
+    floors = get_floors().get(TRAIT, {})
+    panel.dataframe(pd.DataFrame({value: [price] for value, price in sorted(floors.items(), key=str)}, index=["current_price"]))
+
+render_floor(floor_panel)
 
-# get timestamp
-now = datetime.now()
-current_time = now.strftime("%H:%M:%S")
 st.subheader(f"Recent Listings: {TRAIT}")
-st.write("Refreshed at ", current_time)
+# only this placeholder is redrawn when scrape_new_listings.py publishes a new version of the listings
+recent_listings_panel = st.empty()
 
+def render_recent_listings(panel, version):
+    # listings written before version stamps are cached by their modification time, a missing store is empty
+    if version is None and os.path.exists(IMPUT_PATH_REC_LISTINGS):
+        version = os.stat(IMPUT_PATH_REC_LISTINGS).st_mtime_ns
+    df_rec_listings = get_recent_listings(IMPUT_PATH_REC_LISTINGS, version)
 
-df_snipe = df_rec_listings.merge(df, on="token_id")
-df_snipe["snipe"] = ""
+    df_snipe = data.join_listings(df_rec_listings.head(RECENT_LISTINGS))
+    df_snipe["snipe"] = ""
 
-snipe_criteria = get_snipe_criteria(df_snipe)
-df_snipe.loc[snipe_criteria, "snipe"] = "!!!!!!!!! SNIPE !!!!!!!!!"
-df_snipe["listed_seconds_ago"] = ((df_snipe["created_date"] - pd.to_datetime(datetime.utcnow())).astype("timedelta64[s]")).astype(int)
+    # rules of the collection in snipe_rules.json
+    snipe_criteria = get_snipe_mask(df_snipe, load_snipe_rules(COLLECTION), get_floors())
+    df_snipe.loc[snipe_criteria, "snipe"] = "!!!!!!!!! SNIPE !!!!!!!!!"
+    df_snipe["listed_seconds_ago"] = ((df_snipe["created_date"] - pd.to_datetime(datetime.utcnow())).astype("timedelta64[s]")).astype(int)
 
-table_columns = ["image_thumbnail_url", "token_id", "snipe", "created_date","listed_seconds_ago", TRAIT, "starting_price", "payment_token_symbol", "last_sale_price", "rarity_rank", "rarity_score" ,"permalink"]
+    table_columns = ["image_thumbnail_url", "token_id", "snipe", "created_date","listed_seconds_ago", TRAIT, "starting_price", "payment_token_symbol", "last_sale_price", "rarity_rank", "rarity_score" ,"permalink"]
 
-st.write(
-    df_snipe[table_columns].to_html(escape=False, formatters=dict(image_thumbnail_url=path_to_image_html)), 
-    unsafe_allow_html=True
-)
+    # get timestamp
+    current_time = datetime.now().strftime("%H:%M:%S")
+    with panel.container():
+        st.write("Refreshed at ", current_time)
+        st.write(
+            df_snipe[table_columns].to_html(escape=False, formatters=dict(image_thumbnail_url=path_to_image_html)),
+            unsafe_allow_html=True
+        )
+
+listings_version = read_version(IMPUT_PATH_REC_LISTINGS)
+render_recent_listings(recent_listings_panel, listings_version)
 
 st.subheader(f"Last Sale Price [ETH]")
 
@@ -109,10 +152,7 @@ trait_value = st.selectbox(
     'Choose the trait value filter on',
     TRAIT_OPTION_VALUES
 )
-if trait_value:
-    df_temp = df[df[TRAIT]==trait_value]
-else:
-    df_temp = df
+df_temp = data.filter_trait(TRAIT, trait_value)
 
 fig = px.scatter(
     df_temp, x=df_temp.event_timestamp, y="last_sale_price", 
@@ -140,4 +180,16 @@ fig = px.box(df_r, x="current_price", points="all",
              hover_data=hover_data_tip
 )
 st.write(fig)
-'''
\ No newline at end of file
+'''
+
+# subscribe to new listings: the script keeps running and only redraws the recent listings panel. streamlit only
+# handles a rerun (e.g. after a widget interaction) inside an st call, so the wait times out every second and the
+# empty heartbeat placeholder is cleared on every pass to let a pending rerun stop this loop
+heartbeat = st.empty()
+while True:
+    heartbeat.empty()
+    new_version = wait_for_version(IMPUT_PATH_REC_LISTINGS, listings_version, timeout=LISTINGS_WAIT_SECONDS)
+    if new_version is not None and new_version != listings_version:
+        render_floor(floor_panel)
+        render_recent_listings(recent_listings_panel, new_version)
+    listings_version = new_version
@@ -1,3 +0,0 @@
-# Dummy file to be overwritten by scrape_new_listings.py and imported in streamlit app dashboard.py 
-# so that it detects new changes in source code and refreshes the app with new data 
-# Random Number: 8235
\ No newline at end of file